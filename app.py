@@ -3,13 +3,23 @@ Jifra 🗼 - AI Smart Translator (Enhanced Edition v11)
 =====================================================
 Features: Translation, SNS, Visual Prompt Generation (3-tier), History, Pin
 Tech: Streamlit + Google GenerativeAI (Legacy SDK)
+翻訳エンジン本体は jifra パッケージ（CLI・HTTP API と共通）。このファイルは画面だけを受け持つ。
 """
 
 import streamlit as st
-import google.generativeai as genai
+import collections
+import hashlib
 import re
+import sys
+import threading
 import time
-import random
+import uuid
+import functools
+
+from jifra import Config, Engine, PRIORITY_FREE, PRIORITY_PRO, parse_result
+from jifra.parser import BlockParser, assemble_chunks
+from jifra.prompts import LANG_NAMES, resolve_back
+from jifra.segments import batch_to_csv, read_segments
 
 # =============================================================================
 # 1. 認証設定
@@ -21,6 +31,17 @@ except KeyError:
     st.error("❌ Secrets not configured.")
     st.stop()
 
+# エンジンの設定（キャッシュ・レート制限・モデル・履歴・計測・翻訳メモリ・ジョブ）は secrets の同名キーで上書き可能
+CONFIG = Config(st.secrets)
+
+# 画面側の設定
+HISTORY_PRO_LIMIT = int(st.secrets.get("history_pro_limit", 5000))
+HISTORY_PAGE_SIZE = int(st.secrets.get("history_page_size", 20))
+HISTORY_KEY_MIN = 8
+ADMIN_PASSWORD = st.secrets.get("admin_password")
+BATCH_MAX_ROWS = int(st.secrets.get("batch_max_rows", 500))
+JOB_POLL_SEC = float(st.secrets.get("job_poll_sec", 0.5))
+
 # =============================================================================
 # 2. ページ基本設定 & Session State
 # =============================================================================
@@ -28,9 +49,12 @@ st.set_page_config(page_title="Jifra 🗼", page_icon="🗼", layout="centered")
 
 if 'style' not in st.session_state: st.session_state.style = 'casual'
 if 'prompt_level' not in st.session_state: st.session_state.prompt_level = 1
-if 'history' not in st.session_state: st.session_state.history = []
+if 'history_page' not in st.session_state: st.session_state.history_page = 0
 if 'current_result' not in st.session_state: st.session_state.current_result = None
 if 'input_text' not in st.session_state: st.session_state.input_text = ""
+if 'batch_result' not in st.session_state: st.session_state.batch_result = None
+if 'job_id' not in st.session_state: st.session_state.job_id = None
+if 'job_error' not in st.session_state: st.session_state.job_error = None
 
 # =============================================================================
 # 3. カスタムデザイン (CSS)
@@ -193,113 +217,343 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # =============================================================================
-# 4. モデル初期化
+# 4. 翻訳エンジン（全セッション共有）
 # =============================================================================
 @st.cache_resource
-def init_model():
-    try:
-        genai.configure(api_key=API_KEY)
-        available = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        priority = ["models/gemini-1.5-flash", "models/gemini-pro", "models/gemini-1.0-pro"]
-        target = next((p for p in priority if p in available), available[0] if available else "models/gemini-1.5-flash")
-        return genai.GenerativeModel(target), target
-    except Exception as e:
-        return None, str(e)
-
-def call_api(model, prompt):
-    max_retries = 3
-    for i in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            return response.text, None
-        except Exception as e:
-            if "429" in str(e) and i < max_retries - 1:
-                time.sleep((2 ** i) + random.random())
-                continue
-            return None, str(e)
-    return None, "Error"
+def get_engine():
+    return Engine(CONFIG)
+
+
+def get_user_id():
+    # 利用者ID: サイドバーの履歴キーから作る（URL には載せない。共有したリンクから履歴を読まれないように）
+    # キーがなければこのセッション限りのID
+    key = st.session_state.get("history_key", "")
+    if len(key) >= HISTORY_KEY_MIN:
+        return hashlib.sha256(f"jifra-history:{key}".encode("utf-8")).hexdigest()[:32]
+    if 'user_id' not in st.session_state:
+        # 以前の ?u= は読まずに URL から消す
+        if "u" in st.query_params:
+            del st.query_params["u"]
+        st.session_state.user_id = uuid.uuid4().hex
+    return st.session_state.user_id
+
+
+def get_session_id():
+    # ブラウザのセッションごとのID（同じ履歴キーを使う複数のセッションも別々に数える）
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+@st.cache_resource
+def get_footprints():
+    # セッションID → (session_state のおおよそのバイト数, 時刻, 利用者ID)。Metrics で全セッション分を集計する
+    return threading.Lock(), collections.OrderedDict()
+
+def state_bytes(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(state_bytes(k) + state_bytes(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(state_bytes(v) for v in obj)
+    return size
+
+def record_footprint(user_id):
+    session_id = get_session_id()
+    size = state_bytes(st.session_state.to_dict())
+    lock, footprints = get_footprints()
+    now = time.time()
+    # 翻訳メモリの索引と同じく、memory_idle_sec 来ていないセッションは捨てる（古い順に並べ、先頭から見る）
+    cutoff = now - CONFIG.memory_idle_sec
+    with lock:
+        footprints[session_id] = (size, now, user_id)
+        footprints.move_to_end(session_id)
+        while next(iter(footprints.values()))[1] < cutoff:
+            footprints.popitem(last=False)
+    return size
+
+def session_footprints():
+    lock, footprints = get_footprints()
+    with lock:
+        return dict(footprints)
 
 # =============================================================================
-# 5. 履歴管理
+# 5. 結果表示
 # =============================================================================
-def add_history(result, is_pro):
-    lines = result.strip().split('\n')
-    extracted_texts = []
-    
-    # テキスト抽出（ラベルや戻し訳を除外）
-    for line in lines:
-        line = line.strip()
-        if line and not line.startswith('(') and not line.startswith('[') and not line.endswith(':') and len(line) > 2:
-            extracted_texts.append(line)
-    
-    # 重複を除去しつつ、リストの逆順（生成順）で追加していく
-    # そうすることで、最新のものが一番上に来るようにinsert(0, ...)する
-    seen = set()
-    unique_texts = []
-    for t in extracted_texts:
-        if t not in seen:
-            unique_texts.append(t)
-            seen.add(t)
-    
-    # 逆順にしてinsertすることで、結果的に元の順序と同じ並び（あるいは意図した順序）で履歴に残るように調整
-    # ここでは「リストの最後（＝最後のバリエーション）」を先にinsertし、
-    # その後に「リストの最初（＝最初のバリエーション）」をinsertすれば、履歴の一番上が「最初のバリエーション」になる
-    # Historyは insert(0) なので、後に入れたものが上に来る。
-    # つまり、リストの後ろから順に入れていけば、リストの先頭がHistoryの先頭になる。
-    
-    for text in reversed(unique_texts):
-        st.session_state.history.insert(0, {"id": time.time() + random.random(), "text": text, "result": result, "pinned": False})
+def render_block(b):
+    if b["label"]:
+        st.markdown(f'<span class="lang-flag">{b["label"]}</span>', unsafe_allow_html=True)
+    if b["text"]:
+        st.code(b["text"], language="text")
+        if b["back"]:
+            st.markdown(f'<p class="back-trans">{b["back"]}</p>', unsafe_allow_html=True)
+
+# =============================================================================
+# 6. 履歴・結果表示（フラグメント）
+# =============================================================================
+# ピン留めやページ送りでは、このフラグメントだけが再実行される
+@st.fragment
+def render_history(is_pro):
+    started = time.perf_counter()
+    engine = get_engine()
+    store = engine.history
+    user_id = get_user_id()
+
+    def set_page(page): st.session_state.history_page = page
+    def clear():
+        store.clear(user_id)
+        engine.memory.clear(user_id)
+        st.session_state.history_page = 0
 
+    query = ""
+    if is_pro:
+        query = st.text_input("🔍", placeholder="Search...", label_visibility="collapsed", key="history_query", on_change=set_page, args=(0,))
+    # 表示中のページだけを読み込む（FREE は最新の1件だけを見せる。保存されている履歴は消さない）
+    page = st.session_state.history_page
     if not is_pro:
-        st.session_state.history = st.session_state.history[:1]
+        entries, has_next, page = store.latest(user_id), False, 0
+    else:
+        entries, has_next = store.page(user_id, query, page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE)
+    if not entries and page > 0:
+        st.session_state.history_page = page = 0
+        entries, has_next = store.page(user_id, query, 0, HISTORY_PAGE_SIZE)
+    if not entries:
+        st.caption("Empty")
     else:
-        pinned = [h for h in st.session_state.history if h.get("pinned")]
-        unpinned = [h for h in st.session_state.history if not h.get("pinned")]
-        st.session_state.history = (pinned + unpinned)[:20]
+        pinned_count = store.pinned_count(user_id) if is_pro else 0
+        for h in entries:
+            is_pinned = h["pinned"]
+            css = "history-text history-pinned" if is_pinned else "history-text"
+            
+            # アイコンでピン表示
+            if is_pro:
+                col1, col2 = st.columns([6, 1])
+                with col1:
+                    # 生成文をcodeブロックで表示（コピーボタン付き）
+                    st.code(h["text"], language=None)
+                with col2:
+                    if is_pinned:
+                        st.button("📌", key=f"u_{h['id']}", help="Unpin", on_click=store.set_pinned, args=(user_id, h["id"], False))
+                    elif pinned_count < 5:
+                        st.button(" ", key=f"p_{h['id']}", help="Pin", on_click=store.set_pinned, args=(user_id, h["id"], True))
+            else:
+                st.code(h["text"], language=None)
+        
+        if page > 0 or has_next:
+            prev_col, page_col, next_col = st.columns([1, 1, 1])
+            with prev_col:
+                st.button("◀", disabled=page == 0, key="history_prev", on_click=set_page, args=(page - 1,))
+            with page_col:
+                st.caption(f"{page + 1}")
+            with next_col:
+                st.button("▶", disabled=not has_next, key="history_next", on_click=set_page, args=(page + 1,))
+        
+        st.button("🗑️ Clear", on_click=clear)
+
+    if is_pro:
+        st.caption(f"⏱ history {(time.perf_counter() - started) * 1000:.0f} ms")
+
+@st.fragment
+def render_result(is_pro):
+    if not st.session_state.current_result:
+        return
+    started = time.perf_counter()
+    st.divider()
+    res_data = st.session_state.current_result
+    back = res_data.get("back", True)
+    
+    if res_data.get("chunks"):
+        render_chunks(res_data["chunks"], res_data.get("lang"), back)
+    elif res_data.get("preflight"):
+        # 訳すものがない入力（絵文字・URL・数字だけ）はそのまま表示
+        st.code(res_data["raw"], language="text")
+    else:
+        raw = res_data["raw"]
+        parse_started = time.perf_counter()
+        blocks = parse_result(raw, res_data.get("lang"), back)
+        get_engine().metrics.timing("parse", (time.perf_counter() - parse_started) * 1000)
+        if blocks:
+            for b in blocks:
+                render_block(b)
+        else:
+            st.code(raw, language="text")
+
+    # 逆翻訳なしで生成した結果（日本語への翻訳と SNS は逆翻訳を出さない）
+    if not back and res_data.get("style") != "sns" and res_data.get("lang") != "ja":
+        render_backs(res_data, is_pro)
+
+    if is_pro:
+        st.caption(f"⏱ result {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def render_backs(res_data, is_pro):
+    # 開いた時にだけ、結果の全部の案をまとめて1回で逆翻訳する（結果に保存し、開き直しでは呼ばない）
+    with st.expander("🔁 Back-translation", key="back_open", on_change="rerun"):
+        if not st.session_state.get("back_open"):
+            return
+        lang, back = res_data.get("lang"), res_data.get("back", True)
+        raws = res_data.get("chunks") or [res_data["raw"]]
+        blocks = [b for raw in raws for b in parse_result(raw, lang, back)]
+        if "backs" not in res_data:
+            with st.spinner("⏳"):
+                backs, err = get_engine().back_translate([b["text"] for b in blocks], PRIORITY_PRO if is_pro else PRIORITY_FREE)
+            if err:
+                st.error(f"❌ {err}")
+                return
+            res_data["backs"] = backs
+        for b, text in zip(blocks, res_data["backs"]):
+            st.caption(f"{b['label']} {b['text'][:60]}" if b["label"] else b["text"][:60])
+            if text:
+                st.markdown(f'<p class="back-trans">{text}</p>', unsafe_allow_html=True)
+
+def render_chunk(no, total, raw, lang, back=True):
+    st.caption(f"§ {no} / {total}")
+    blocks = parse_result(raw, lang, back)
+    if blocks:
+        for b in blocks:
+            render_block(b)
+    else:
+        st.code(raw, language="text")
+
+def render_chunks(chunks, lang, back=True):
+    # 分割翻訳: 連結した全文（コピー用）と、逆翻訳つきのチャンクごとの結果
+    parse_started = time.perf_counter()
+    full = assemble_chunks(chunks, lang, back)
+    get_engine().metrics.timing("parse", (time.perf_counter() - parse_started) * 1000)
+    with st.expander(f"📄 Full text ({len(chunks)} parts)"):
+        for b in full:
+            render_block(b)
+    for no, raw in enumerate(chunks, 1):
+        render_chunk(no, len(chunks), raw, lang, back)
+
+@st.fragment(run_every=JOB_POLL_SEC)
+def render_job():
+    jobs = get_engine().jobs
+    job = jobs.get(st.session_state.job_id)
+    if job is None:
+        # 取り消し済み、または期限切れで消えたジョブ
+        st.session_state.job_id = None
+        return
+
+    if job.status in ("queued", "running"):
+        def cancel():
+            jobs.cancel(job.id)
+            st.session_state.job_id = None
+        st.divider()
+        if job.parts:
+            done = [(i, row) for i, row in enumerate(job.parts) if row is not None]
+            st.progress(len(done) / len(job.parts), text=f"{len(done)} / {len(job.parts)}")
+            for i, row in done:
+                if row["error"]:
+                    st.caption(f"§ {i + 1} / {len(job.parts)}")
+                    st.error(f"❌ {row['error']}")
+                else:
+                    render_chunk(i + 1, len(job.parts), row["output"], job.lang, job.back)
+        elif job.partial:
+            # 受信済みの本文のうち、確定したブロックだけを表示する
+            for b in BlockParser(separated=not job.back).feed("".join(job.partial)):
+                render_block(b)
+        else:
+            st.caption("⏳ Queued..." if job.status == "queued" else "⏳ Generating...")
+        st.button("⏹ Cancel", on_click=cancel)
+        return
+
+    # 終わったら結果を反映し、アプリ全体を再実行して結果・履歴の表示を更新する
+    st.session_state.job_id = None
+    if job.status == "done":
+        st.session_state.current_result = job.result
+    elif job.status == "error":
+        st.session_state.job_error = job.error
+    jobs.forget(job.id)
+    st.rerun()
+
+@st.fragment(run_every=30)
+def render_metrics_page():
+    # 管理者専用: 計測値の集計表示
+    st.markdown('<h1 class="main-title">📊 Metrics</h1>', unsafe_allow_html=True)
+    engine = get_engine()
+    s = engine.metrics.summary()
+    api = s["api"]
+    total = s["total"]
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Requests", total)
+    m2.metric("Cache / memory / coalesced", f"{(s['cache'] + s['memory'] + s['coalesced']) / total:.0%}" if total else "-")
+    m3.metric("Error rate", f"{api['errors'] / api['requests']:.1%}" if api["requests"] else "-")
+    m4.metric("429", api["throttled_429"])
+
+    l1, l2, l3, l4 = st.columns(4)
+    l1.metric("p50", f"{api['p50_ms'] / 1000:.2f}s")
+    l2.metric("p95", f"{api['p95_ms'] / 1000:.2f}s")
+    l3.metric("p99", f"{api['p99_ms'] / 1000:.2f}s")
+    l4.metric("Retries", api["retries"])
+
+    # 待ち行列とAPI応答のどちらが遅いのかを切り分ける
+    st.caption(f"queue p95 {s['queue_p95_ms']:.0f} ms · generate_content p95 {s['api_p95_ms']:.0f} ms · parse p50/p95 {s['parse_p50_ms']:.1f}/{s['parse_p95_ms']:.1f} ms · tokens in {api['input_tokens']} / out {api['output_tokens']}")
+    if s["by_mode"]:
+        st.dataframe(s["by_mode"], use_container_width=True, hide_index=True)
+    # モデルごとの応答時間・エラー率（ルーターの振り分けの根拠）
+    rs = engine.model.snapshot()
+    st.caption(f"🔀 hedges {rs['hedges']} · failovers {rs['failovers']}")
+    # API を呼ばずに済ませた入力（プリフライト）
+    pf = s["preflight"]
+    st.caption(f"🔎 preflight empty {pf['empty']} · passthrough {pf['passthrough']} · same language {pf['same']}")
+    st.dataframe(rs["models"], use_container_width=True, hide_index=True)
+    rl = engine.limiter.snapshot()
+    cs = engine.cache.snapshot()
+    st.caption(f"🚦 queue {rl['depth']} (max {rl['max_depth']}) · wait p95 {rl['wait_p95']:.1f}s · ⚡ cache hit {cs['hit_rate']:.0%}")
+    # セッションごとの session_state と、翻訳メモリの索引（予算を超えると使われていない利用者から捨てる）
+    ms = engine.memory.snapshot()
+    footprints = session_footprints().values()
+    sizes = [b for b, _, _ in footprints]
+    state = f"avg {sum(sizes) / len(sizes) / 1024:.1f} KB / max {max(sizes) / 1024:.1f} KB" if sizes else "-"
+    st.caption(f"🧮 sessions {len(sizes)} ({len({u for _, _, u in footprints})} users) · state {state} · 🧠 index {ms['bytes'] / 2**20:.1f} / {ms['budget_bytes'] / 2**20:.0f} MB · {ms['users']} users · evicted {ms['evicted']}")
+    if s["recent_errors"]:
+        st.subheader("Recent errors")
+        for r in reversed(s["recent_errors"]):
+            st.code(f"{time.strftime('%H:%M:%S', time.localtime(r['ts']))} [{r.get('style')}/{r.get('lang')}] {r.get('error')}", language=None)
 
 # =============================================================================
-# 6. メインUI
+# 7. メインUI
 # =============================================================================
 def main():
-    model, model_name = init_model()
+    started = time.perf_counter()
+    engine = get_engine()
 
     with st.sidebar:
         st.header("⚙️")
         pwd = st.text_input("🔑 PRO", type="password")
-        is_pro = (pwd == PRO_PASSWORD)
+        is_admin = bool(ADMIN_PASSWORD) and pwd == ADMIN_PASSWORD
+        is_pro = (pwd == PRO_PASSWORD) or is_admin
+        priority = PRIORITY_PRO if is_pro else PRIORITY_FREE
         if is_pro: st.success("✨ PRO")
+        streaming = st.toggle("⚡ Streaming", value=True, help="Show each result as soon as it is generated")
+        use_memory = st.toggle("🧠 Memory", value=True, help="Reuse the result of a similar past input instead of calling the model")
+        back = not st.toggle("🔁 Back-translation on open", value=True, help="Generate without back-translations and fetch them only when you open them")
+        view = st.radio("View", ["🗼 Translator", "📊 Metrics"], horizontal=True, label_visibility="collapsed") if is_admin else "🗼 Translator"
         
         st.divider()
         st.subheader("📜 History")
-        if not st.session_state.history:
-            st.caption("Empty")
-        else:
-            pinned_count = sum(1 for h in st.session_state.history if h.get("pinned"))
-            for h in st.session_state.history:
-                is_pinned = h.get("pinned", False)
-                css = "history-text history-pinned" if is_pinned else "history-text"
-                
-                # アイコンでピン表示
-                if is_pro:
-                    col1, col2 = st.columns([6, 1])
-                    with col1:
-                        # 生成文をcodeブロックで表示（コピーボタン付き）
-                        st.code(h["text"], language=None)
-                    with col2:
-                        if is_pinned:
-                            if st.button("📌", key=f"u_{h['id']}", help="Unpin"):
-                                h["pinned"] = False
-                                st.rerun()
-                        elif pinned_count < 5:
-                            if st.button(" ", key=f"p_{h['id']}", help="Pin"):
-                                h["pinned"] = True
-                                st.rerun()
-                else:
-                    st.code(h["text"], language=None)
-            
-            if st.button("🗑️ Clear"):
-                st.session_state.history = [h for h in st.session_state.history if h.get("pinned")]
-                st.rerun()
+        key = st.text_input("🗝️ History key", type="password", key="history_key",
+                            help="Enter the same key on any browser to keep your history. Without it, history lasts for this session only.")
+        if key and len(key) < HISTORY_KEY_MIN:
+            st.caption(f"Use at least {HISTORY_KEY_MIN} characters")
+        history_slot = st.container()
+
+        if is_pro:
+            cs = engine.cache.snapshot()
+            sf = engine.singleflight.snapshot()
+            st.caption(f"⚡ Cache {cs['hit_rate']:.0%} (hit {cs['memory_hits'] + cs['disk_hits']} / miss {cs['misses']}) · coalesced {sf['followers']}")
+            ms = engine.memory.snapshot()
+            st.caption(f"🧠 Memory {ms['hit_rate']:.0%} (hit {ms['hits']} / {ms['lookups']}) · {ms['entries']} entries")
+            rl = engine.limiter.snapshot()
+            st.caption(f"🚦 Queue {rl['depth']} (max {rl['max_depth']}) · wait avg {rl['wait_avg']:.1f}s / p95 {rl['wait_p95']:.1f}s · 429 {rl['throttled']}")
+            js = engine.jobs.snapshot()
+            st.caption(f"🧵 Jobs running {js['running']} · queued {js['queued']} · cancelled {js['cancelled']}")
+            footprint_slot = st.empty()
+        timing_slot = st.empty()
+
+    if view == "📊 Metrics":
+        render_metrics_page()
+        return
 
     st.markdown('<h1 class="main-title">Jifra 🗼</h1>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">Smart Translator</p>', unsafe_allow_html=True)
@@ -348,7 +602,10 @@ def main():
         opts = ["ja", "fr"]
         if is_pro: opts.append("en")
         
-        format_map = {"ja": "➡JP", "fr": "➡FR", "en": "➡EN"}
+        langs = list(opts)
+        opts.append("all")
+        
+        format_map = {"ja": "➡JP", "fr": "➡FR", "en": "➡EN", "all": "🌐 ALL"}
         
         # デフォルト設定
         if 'sel_lang' not in st.session_state: st.session_state.sel_lang = 'fr'
@@ -363,6 +620,8 @@ def main():
             index=opts.index(st.session_state.sel_lang)
         )
         st.session_state.sel_lang = sel_lang
+        if sel_lang == "all":
+            sel_lang = "+".join(langs)
     else:
         sel_lang = None
 
@@ -378,142 +637,132 @@ def main():
         run_btn = st.button(btn_label, type="primary", use_container_width=True)
     with col_clear:
         if st.button("🗑️", use_container_width=True):
+            if st.session_state.job_id:
+                engine.jobs.cancel(st.session_state.job_id)
+                st.session_state.job_id = None
             st.session_state.input_text = ""
             st.session_state.current_result = None
+            st.session_state.pop("back_open", None)
             st.rerun()
 
-    if run_btn and input_text.strip():
-        with st.spinner("⏳ Generating..."):
-            STRICT = "OUTPUT ONLY THE RESULT. NO INTRO. NO CHAT. NO EXPLANATION. SEPARATE EACH OUTPUT WITH A BLANK LINE."
-            
-            if st.session_state.style == "prompt":
-                level = st.session_state.prompt_level
-                
-                if level == 1:
-                    # ★ Literal: 画像生成視点の忠実な翻訳
-                    prompt = f"""{STRICT}
-Convert this to a simple English image generation prompt.
-Keep the original meaning but phrase it for visual AI (describe what to see, not actions).
-Output the English prompt first, then the Japanese back-translation in parentheses on a NEW LINE.
-
-{input_text}"""
-                elif level == 2:
-                    # ★★ Creative: 豊かな表現（短め）
-                    prompt = f"""{STRICT}
-Create a concise image prompt with atmosphere and mood. Keep it under 30 words.
-Output English first, then Japanese translation in parentheses on a NEW LINE.
-
-{input_text}"""
-                else:
-                    # ★★★ Masterpiece: プロ仕様タグ
-                    prompt = f"""{STRICT}
-Create a professional-level image generation prompt with:
-- Camera settings (lens, aperture, etc.)
-- Lighting (natural, studio, golden hour, etc.)
-- Art style (photorealistic, anime, oil painting, etc.)
-Use comma-separated format.
-Output the English prompt first, then the Japanese back-translation in parentheses on a NEW LINE.
-
-{input_text}"""
-                    
-            elif st.session_state.style == "sns":
-                prompt = f"""{STRICT}
-Translate to JP/EN/FR for SNS. No imaginary content. Add emoji and hashtags.
-Use [JP] [EN] [FR] as labels.
-
-[JP] [text]
-#tags
-
-[EN] [text]
-#tags
-
-[FR] [text]
-#tags
-
-Input: {input_text}"""
-            else:
-                tone = "casual friendly" if st.session_state.style == 'casual' else "formal polite"
-                lang_name = {"ja": "Japanese", "fr": "French", "en": "English"}[sel_lang]
-                prompt = f"""{STRICT}
-Translate to {lang_name} in {tone} tone. 
-Give 2 variations. Each variation should be on its own line.
-After each variation, add the Japanese back-translation in parentheses on a NEW LINE.
-Do NOT combine them on the same line.
-
-Input: {input_text}"""
-            
-            res, err = call_api(model, prompt)
-        
-        if err:
-            st.error(f"❌ {err}")
-        else:
-            st.session_state.current_result = {"raw": res, "style": st.session_state.style}
+    # 「Call model」ボタン: 翻訳メモリを使わずに同じ入力を生成し直す
+    # 「Translate anyway」・翻訳先の提案ボタン: プリフライトの判定を飛ばして生成する
+    bypass_memory = st.session_state.pop("memory_bypass", False)
+    bypass_preflight = st.session_state.pop("preflight_bypass", False)
+    run = run_btn or bypass_memory or bypass_preflight
+    recall_on = use_memory and not bypass_memory
+    style, level = st.session_state.style, st.session_state.prompt_level
+    back = resolve_back(style, back)
+    user_id = get_user_id()
+    # FREE の1件表示は読み出し時に絞る（PRO で貯めた履歴を FREE での生成で消さない）
+    history_limit = HISTORY_PRO_LIMIT
+
+    # 生成はワーカーのジョブとして投入し、このスクリプトのスレッドは待たない（1セッション1ジョブ）
+    def submit(fn, total=0):
+        jobs = engine.jobs
+        if st.session_state.job_id:
+            jobs.cancel(st.session_state.job_id)
+        st.session_state.job_id = jobs.submit(fn, total, sel_lang, back).id
+        st.session_state.current_result = None
+        st.session_state.pop("back_open", None)
+        st.session_state.input_text = input_text
+
+    # API を呼ぶ前にローカルで入力を判定する（空・絵文字や URL だけ・翻訳先と同じ言語）
+    pre = engine.preflight(style, level, sel_lang, input_text) if run and not bypass_preflight else None
+    if pre and pre.action == "empty":
+        run = False
+    elif pre and pre.action == "passthrough":
+        # そのまま表示する（履歴・メモリには登録しない）
+        run = False
+        st.session_state.current_result = {"raw": input_text.strip(), "style": style, "lang": sel_lang, "preflight": pre.action}
+        st.session_state.pop("back_open", None)
+        st.session_state.input_text = input_text
+    elif pre and pre.action == "same":
+        # 生成せず、別の翻訳先か、そのまま生成するかを選んでもらう
+        run = False
+        st.session_state.current_result = None
+        st.session_state.input_text = input_text
+        def switch_lang(): st.session_state.update(sel_lang=pre.suggest, preflight_bypass=True)
+        def translate_anyway(): st.session_state.preflight_bypass = True
+        st.info(f"🔎 Input looks like {LANG_NAMES[pre.lang]}")
+        col_switch, col_anyway = st.columns(2)
+        with col_switch:
+            st.button(f"{format_map[pre.suggest]} instead", on_click=switch_lang, use_container_width=True)
+        with col_anyway:
+            st.button("✈️ Translate anyway", on_click=translate_anyway, use_container_width=True)
+
+    # 長文（翻訳モードのみ）は分割して並列に翻訳する
+    chunks = engine.chunks_for(style, input_text) if run else []
+
+    if chunks:
+        submit(functools.partial(engine.generate_long, user=user_id, style=style, level=level, lang=sel_lang, chunks=chunks,
+                                 priority=priority, history_limit=history_limit, source=input_text, use_memory=recall_on, back=back), len(chunks))
+
+    elif run and input_text.strip():
+        match = engine.recall(user_id, style, level, sel_lang, input_text, back) if recall_on else None
+        if match:
+            # 似た入力の結果をそのまま表示（履歴・メモリには登録しない）
+            st.session_state.current_result = {"raw": match["raw"], "style": style, "lang": sel_lang, "back": back, "memory": {"score": match["score"], "source": match["source"], "parts": 0}}
+            st.session_state.pop("back_open", None)
             st.session_state.input_text = input_text
-            add_history(res, is_pro)
-            st.rerun()
+        else:
+            submit(functools.partial(engine.generate_text, user=user_id, style=style, level=level, lang=sel_lang, input_text=input_text,
+                                     priority=priority, history_limit=history_limit, streaming=streaming, back=back))
 
-    # 結果表示
-    if st.session_state.current_result:
-        st.divider()
-        res_data = st.session_state.current_result
-        raw = res_data["raw"]
-        
-        lines = raw.strip().split('\n')
-        blocks = []
-        current_block = {"text": "", "back": "", "label": ""}
-        
-        for line in lines:
-            line = line.strip()
-            if not line: continue
-            
-            # SNSラベル
-            if line.startswith('[JP]') or line.startswith('[EN]') or line.startswith('[FR]'):
-                if current_block["text"]:
-                    blocks.append(current_block)
-                    current_block = {"text": "", "back": "", "label": ""}
-                label = line[:4]
-                current_block["label"] = {"[JP]": "JP", "[EN]": "EN", "[FR]": "FR"}.get(label, label)
-                current_block["text"] = line[4:].strip()
-                continue
-            
-            # 戻し訳（括弧で始まり括弧で終わる）
-            if line.startswith('(') and line.endswith(')'):
-                current_block["back"] = line
-                if current_block["text"]:
-                    blocks.append(current_block)
-                    current_block = {"text": "", "back": "", "label": ""}
-            # ラベル行をスキップ
-            elif line.startswith('[') and line.endswith(']'):
-                if current_block["text"]:
-                    blocks.append(current_block)
-                current_block = {"text": "", "back": "", "label": ""}
+    if st.session_state.job_error:
+        st.error(f"❌ {st.session_state.job_error}")
+        st.session_state.job_error = None
+    # 生成中は途中経過を定期的に確認する（終わったらアプリ全体を再実行して結果・履歴を更新）
+    if st.session_state.job_id:
+        render_job()
+
+    # 翻訳メモリから出した結果: 元の入力と類似度を示し、モデルでの生成も選べるようにする
+    res_data = st.session_state.current_result
+    if res_data and res_data.get("memory"):
+        mem = res_data["memory"]
+        def call_model(): st.session_state.memory_bypass = True
+        col_note, col_model = st.columns([3, 2])
+        with col_note:
+            if mem["parts"]:
+                st.caption(f"🧠 Memory · {mem['parts']} / {len(res_data['chunks'])} parts (≥ {mem['score']:.0%})")
             else:
-                # 通常テキスト
-                if current_block["text"]:
-                    # 同じブロックに追加しない、新しいブロックとして追加
-                    if current_block["back"]:
-                        # 既に戻し訳がある場合は新しいブロック
-                        blocks.append(current_block)
-                        current_block = {"text": line, "back": "", "label": ""}
-                    else:
-                        # まだ戻し訳がない場合は改行で追加
-                        current_block["text"] += "\n" + line
+                st.caption(f"🧠 Memory {mem['score']:.0%} · {mem['source'][:80]}")
+        with col_model:
+            st.button("✈️ Call model", on_click=call_model, use_container_width=True)
+    elif res_data and res_data.get("preflight"):
+        st.caption("🔎 Nothing to translate · shown as is")
+
+    # 結果表示・履歴（それぞれ単独で再実行できるフラグメント）
+    render_result(is_pro)
+    with history_slot:
+        render_history(is_pro)
+
+    # バッチ翻訳（PRO）: ファイル内の各行を現在のモードで翻訳
+    if is_pro:
+        st.divider()
+        with st.expander("📦 Batch"):
+            up = st.file_uploader("TXT / CSV", type=["txt", "csv"])
+            concurrency = st.slider("Concurrency", 1, max(1, CONFIG.batch_concurrency), max(1, CONFIG.batch_concurrency))
+            if st.button("▶️ Run batch", disabled=up is None, use_container_width=True):
+                segments = read_segments(up.name, up.getvalue())[:BATCH_MAX_ROWS]
+                if not segments:
+                    st.warning("No text found.")
                 else:
-                    current_block["text"] = line
-        
-        if current_block["text"]:
-            blocks.append(current_block)
-        
-        if blocks:
-            for b in blocks:
-                if b["label"]:
-                    st.markdown(f'<span class="lang-flag">{b["label"]}</span>', unsafe_allow_html=True)
-                if b["text"]:
-                    st.code(b["text"], language="text")
-                    if b["back"]:
-                        st.markdown(f'<p class="back-trans">{b["back"]}</p>', unsafe_allow_html=True)
-        else:
-            st.code(raw, language="text")
+                    bar = st.progress(0.0, text=f"0 / {len(segments)}")
+                    def on_progress(done, total, row):
+                        bar.progress(done / total, text=f"{done} / {total}")
+                    results = engine.run_batch(style, level, sel_lang, segments, concurrency, on_progress)
+                    st.session_state.batch_result = {"name": up.name, "csv": batch_to_csv(results), "failed": sum(1 for r in results if r["error"]), "total": len(results)}
+            
+            if st.session_state.batch_result:
+                br = st.session_state.batch_result
+                st.caption(f"✅ {br['total'] - br['failed']} / {br['total']}" + (f" · ❌ {br['failed']}" if br["failed"] else ""))
+                st.download_button("⬇️ CSV", data=br["csv"], file_name=br["name"].rsplit(".", 1)[0] + "_jifra.csv", mime="text/csv", use_container_width=True)
+
+    state_size = record_footprint(get_user_id())
+    if is_pro:
+        footprint_slot.caption(f"🧮 Session {state_size / 1024:.1f} KB · 🧠 index {engine.memory.footprint(get_user_id()) / 1024:.0f} KB")
+        timing_slot.caption(f"⏱ rerun {(time.perf_counter() - started) * 1000:.0f} ms")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Jifra 🗼 - Gemini 疑似バックエンド（ネットワーク不要）
+=====================================================
+google.generativeai と同じ形の最小モジュールを sys.modules に差し込み、
+init_model() / call_api() をローカルで動かす。
+遅延分布・429 の発生率・モード別の定型出力を設定できる。
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+import types
+
+# モード別の定型出力（app.py のパーサーがそのまま読める形式）
+CANNED = {
+    "casual": "Salut, ça va ?\n(やあ、元気？)\n\nCoucou, tu vas bien ?\n(やっほー、元気にしてる？)",
+    "formal": "Bonjour, comment allez-vous ?\n(こんにちは、お元気ですか？)\n\nBonjour, j'espère que vous allez bien.\n(こんにちは、お元気でいらっしゃることと思います。)",
+    "sns": "[JP] 今日もいい天気☀️\n#晴れ #東京\n\n[EN] Lovely weather today ☀️\n#sunny #tokyo\n\n[FR] Il fait beau aujourd'hui ☀️\n#soleil #tokyo",
+    "prompt": "A quiet street in Tokyo at dusk, warm lanterns, soft rain\n(夕暮れの東京の静かな通り、暖かい提灯、柔らかな雨)",
+    "all": json.dumps({
+        "ja": [{"text": "やあ、元気？", "back": "やあ、元気？"}],
+        "fr": [{"text": "Salut, ça va ?", "back": "やあ、元気？"}],
+        "en": [{"text": "Hey, how are you?", "back": "やあ、元気？"}],
+    }, ensure_ascii=False),
+}
+# 逆翻訳なしのテンプレート用（括弧の行と "back" を除き、案を jifra.prompts.VARIATION_SEPARATOR の行で区切ったもの）
+CANNED_NO_BACK = {
+    mode: json.dumps({k: [{"text": i["text"]} for i in v] for k, v in json.loads(text).items()}, ensure_ascii=False) if mode == "all"
+    else "\n---\n".join(b.split("\n(")[0] for b in text.split("\n\n"))
+    for mode, text in CANNED.items()
+}
+
+class Config:
+    latency_ms = 800.0     # 応答時間の中央値
+    sigma = 0.5            # 対数正規分布の広がり（0 で固定値）
+    error_rate = 0.0       # 429 を返す確率
+    chunk_chars = 12       # ストリーミング時のチャンク長
+    ms_per_char = 0.0      # 出力1文字あたりの追加の遅延（出力トークン数に比例する生成時間の模擬）
+    chars_per_token = 2    # 出力の文字数をトークン数に換算する比率（max_output_tokens を超える出力は打ち切る）
+    models = ["models/gemini-1.5-flash", "models/gemini-pro"]
+
+config = Config()
+stats = {"calls": 0, "throttled": 0, "streamed": 0}
+_lock = threading.Lock()
+
+def _mode(prompt, generation_config):
+    if "user's JSON array" in prompt:
+        return "back"
+    if isinstance(generation_config, dict) and generation_config.get("response_mime_type") == "application/json":
+        return "all"
+    if "[JP] [EN] [FR]" in prompt:
+        return "sns"
+    if "image" in prompt:
+        return "prompt"
+    return "formal" if "formal" in prompt else "casual"
+
+def _latency():
+    if config.sigma <= 0:
+        return config.latency_ms / 1000
+    return random.lognormvariate(0, config.sigma) * config.latency_ms / 1000
+
+class _Usage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 2
+        self.candidates_token_count = len(text) // 2
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+class _Response:
+    def __init__(self, text, usage=None, finish_reason=None):
+        self.text = text
+        self.usage_metadata = usage
+        # 最後のチャンク（ストリーミング以外は唯一の応答）だけが終了理由を持つ
+        self.candidates = [types.SimpleNamespace(finish_reason=types.SimpleNamespace(name=finish_reason))] if finish_reason else []
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+        self.kwargs = kwargs
+
+    def generate_content(self, prompt, stream=False, generation_config=None, **kwargs):
+        if not isinstance(prompt, str):
+            prompt = json.dumps(prompt, ensure_ascii=False, default=str)
+        with _lock:
+            stats["calls"] += 1
+            throttled = random.random() < config.error_rate
+            if throttled:
+                stats["throttled"] += 1
+        if throttled:
+            time.sleep(0.02)
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+
+        system = str(self.kwargs.get("system_instruction", ""))
+        # 呼び出しごとの generation_config はモデルの設定に上書きで重ねる（SDK と同じ）
+        generation_config = {**(self.kwargs.get("generation_config") or {}), **(generation_config or {})}
+        mode = _mode(prompt + system, generation_config)
+        if mode == "back":
+            # 後から取得する逆翻訳: 送られてきた配列と同じ数の訳を返す
+            text = json.dumps([f"逆翻訳: {t}" for t in json.loads(prompt)], ensure_ascii=False)
+        elif "back-translations" in system or "Output only the English prompt" in system:
+            text = CANNED_NO_BACK[mode]
+        else:
+            text = CANNED[mode]
+        finish_reason = "STOP"
+        limit = generation_config.get("max_output_tokens")
+        if limit and len(text) > limit * config.chars_per_token:
+            text, finish_reason = text[:limit * config.chars_per_token], "MAX_TOKENS"
+        delay = _latency() + len(text) * config.ms_per_char / 1000
+        if not stream:
+            time.sleep(delay)
+            return _Response(text, _Usage(prompt, text), finish_reason)
+
+        with _lock:
+            stats["streamed"] += 1
+
+        def chunks():
+            # 全体の遅延をチャンク数で分割して流す
+            pieces = [text[i:i + config.chunk_chars] for i in range(0, len(text), config.chunk_chars)]
+            for n, piece in enumerate(pieces):
+                time.sleep(delay / len(pieces))
+                last = n == len(pieces) - 1
+                yield _Response(piece, _Usage(prompt, text) if last else None, finish_reason if last else None)
+        return chunks()
+
+def configure(**kwargs):
+    pass
+
+def list_models():
+    return [types.SimpleNamespace(name=name, supported_generation_methods=["generateContent"]) for name in config.models]
+
+def install():
+    # app.py（jifra）は google.generativeai を遅延 import するので、実行前に差し込めば差し替わる
+    module = types.ModuleType("google.generativeai")
+    for name in ("GenerativeModel", "configure", "list_models"):
+        setattr(module, name, globals()[name])
+    module.__path__ = []
+    try:
+        import google
+    except ImportError:
+        google = types.ModuleType("google")
+        google.__path__ = []
+        sys.modules["google"] = google
+    google.generativeai = module
+    sys.modules["google.generativeai"] = module
+    return module
@@ -0,0 +1,262 @@
+"""
+Jifra 🗼 - オフライン負荷テスト
+===============================
+疑似 Gemini（bench/fake_gemini.py）に差し替えた app.py を、Streamlit の AppTest で
+多数のセッションから同時に操作し、以下を計測する。
+
+- Translate 押下から結果表示までの遅延（p50/p95/p99。生成はバックグラウンドのジョブなので、画面と同じ間隔で再実行して完了を待つ）
+- 再実行（rerun）数/秒
+- API 呼び出し数・429・リトライ数・出力トークン数（app.py の計測ログから集計）
+- 逆翻訳を後から取得する場合、開いてから表示されるまでの遅延（--open-back の割合で開く）
+- 1セッションあたりのメモリ（tracemalloc）
+
+ネットワーク不要。例:
+    python bench/load_test.py --sessions 20 --requests 5 --latency-ms 300 --error-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_gemini
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# よくある入力（繰り返しが多いほどキャッシュ・合流が効く）
+PHRASES = [
+    "こんにちは、お元気ですか？",
+    "ご注文ありがとうございます。発送までしばらくお待ちください。",
+    "明日の会議は10時からです。",
+    "お問い合わせいただきありがとうございます。",
+    "東京の夜景がきれいです",
+    "週末は京都に行きます！",
+    "返品の手続きについてご案内します。",
+    "猫が窓辺で昼寝している",
+]
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def write_secrets(args, workdir):
+    # AppTest.secrets は st.secrets を全体で差し替えるため並行実行できない
+    # 作業ディレクトリの secrets.toml を全セッションで共有する（キャッシュ等のファイルも作業ディレクトリに作られる）
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write(f'gemini_api_key = "offline"\npro_password = "bench"\nrate_rpm = {args.rpm}\nrate_tpm = {args.tpm}\njob_poll_sec = {args.poll_ms / 1000}\n')
+
+def share_runtime():
+    # AppTest は実行ごとに Runtime._instance を差し替え・破棄するため、そのままでは並行実行できない
+    # 全セッションで共有する1つの疑似 Runtime を返すようにする（1プロセスに多数のセッションがある本番と同じ形）
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    try:
+        from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+        runtime.dataframe_source_mgr = DataframeSourceManager()
+    except ImportError:
+        pass
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+    # AppTest は実行ごとにスクリプトをコンパイルし直す。並行コンパイルを避けるため1回分を共有する
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    shared = ScriptCache()
+    ScriptCache.get_bytecode = lambda self, path, _get=ScriptCache.get_bytecode: _get(shared, path)
+
+def run_session(args, sid, results, sessions, failures):
+    try:
+        simulate(args, sid, results, sessions)
+    except Exception as e:
+        # stderr は捨てているので、失敗はレポートに出す
+        failures[sid] = f"{type(e).__name__}: {e}"
+
+def simulate(args, sid, results, sessions):
+    from streamlit.testing.v1 import AppTest
+    rng = random.Random(args.seed + sid)
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    reruns = 0
+    latencies = []
+    errors = 0
+    at.run()
+    reruns += 1
+    if rng.random() < args.pro_ratio:
+        at.sidebar.text_input[0].input("bench").run()
+        reruns += 1
+    if not args.streaming:
+        at.sidebar.toggle[0].set_value(False).run()
+        reruns += 1
+    if not args.lazy_back:
+        at.sidebar.toggle[2].set_value(False).run()
+        reruns += 1
+    back_latencies = []
+
+    for _ in range(args.requests):
+        style = rng.choice(args.styles)
+        button = {"casual": "Casual", "formal": "Formal", "sns": "SNS", "prompt": "Prompt"}[style]
+        mode = next((b for b in at.button if button in b.label), None)
+        if mode is not None and not mode.disabled:
+            mode.click().run()
+            reruns += 1
+        text = rng.choice(PHRASES[:args.distinct]) if rng.random() < args.repeat else f"{rng.choice(PHRASES)} #{sid}-{rng.random():.6f}"
+        if not at.text_area:
+            raise RuntimeError(f"session {sid}: page did not render: {at.exception} {[e.value for e in at.error]}")
+        at.text_area[0].input(text).run()
+        reruns += 1
+
+        started = time.perf_counter()
+        run = next(b for b in at.button if "Translate" in b.label or "Metamorph" in b.label)
+        run.click().run()
+        reruns += 1
+        # ジョブが終わるまで、フラグメントの定期実行と同じ間隔で再実行する
+        while at.session_state.job_id:
+            if time.perf_counter() - started > args.timeout:
+                raise RuntimeError(f"session {sid}: job did not finish in {args.timeout}s")
+            time.sleep(args.poll_ms / 1000)
+            at.run()
+            reruns += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+        if at.exception or at.error:
+            errors += 1
+        # 逆翻訳を開く（開いた時にだけ取得される）
+        if args.lazy_back and any("Back-translation" in e.label for e in at.expander) and rng.random() < args.open_back:
+            opened = time.perf_counter()
+            at.session_state["back_open"] = True
+            at.run()
+            reruns += 1
+            back_latencies.append((time.perf_counter() - opened) * 1000)
+        if args.think_ms:
+            time.sleep(rng.random() * args.think_ms / 1000)
+
+    results[sid] = {"latencies": latencies, "back_latencies": back_latencies, "reruns": reruns, "errors": errors}
+    # メモリ計測のためセッションを保持しておく
+    sessions[sid] = at
+
+def read_metrics(path):
+    records = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+    except OSError:
+        pass
+    return [r for r in records if r.get("event") == "request"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for app.py with a simulated Gemini backend")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--requests", type=int, default=5, help="generations per session")
+    parser.add_argument("--styles", default="casual,formal,prompt", help="comma-separated styles to exercise (sns needs PRO)")
+    parser.add_argument("--pro-ratio", type=float, default=0.3, help="share of sessions that sign in as PRO")
+    parser.add_argument("--repeat", type=float, default=0.7, help="probability that an input is a common phrase")
+    parser.add_argument("--distinct", type=int, default=len(PHRASES), help="number of common phrases in use")
+    parser.add_argument("--latency-ms", type=float, default=800, help="median fake generate_content latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal sigma of the fake latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--lazy-back", action=argparse.BooleanOptionalAction, default=True, help="generate without back-translations and fetch them on open")
+    parser.add_argument("--open-back", type=float, default=0.2, help="share of results whose back-translation is opened (with --lazy-back)")
+    parser.add_argument("--ms-per-char", type=float, default=0.0, help="extra fake latency per output character")
+    parser.add_argument("--think-ms", type=float, default=0, help="max random pause between requests")
+    parser.add_argument("--rpm", type=int, default=100000, help="rate limiter requests per minute")
+    parser.add_argument("--tpm", type=int, default=100000000, help="rate limiter tokens per minute")
+    parser.add_argument("--timeout", type=float, default=120, help="per-rerun timeout in seconds")
+    parser.add_argument("--poll-ms", type=float, default=250, help="interval between reruns while a generation job is running")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="trace allocations to estimate memory per session (slower)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep Streamlit's log output on stderr")
+    args = parser.parse_args()
+    args.styles = [s.strip() for s in args.styles.split(",") if s.strip()]
+    if "sns" in args.styles:
+        args.pro_ratio = 1.0
+
+    fake_gemini.config.latency_ms = args.latency_ms
+    fake_gemini.config.sigma = args.sigma
+    fake_gemini.config.error_rate = args.error_rate
+    fake_gemini.config.ms_per_char = args.ms_per_char
+    fake_gemini.install()
+    share_runtime()
+
+    workdir = tempfile.mkdtemp(prefix="jifra-bench-")
+    write_secrets(args, workdir)
+    os.chdir(workdir)
+    if args.memory:
+        tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0] if args.memory else 0
+
+    # AppTest 実行時の警告ログ（ScriptRunContext 等）でレポートが埋もれないよう stderr を捨てる
+    saved_stderr = None
+    if not args.verbose:
+        saved_stderr = os.dup(2)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 2)
+        os.close(devnull)
+
+    results, sessions, failures = {}, {}, {}
+    threads = [threading.Thread(target=run_session, args=(args, sid, results, sessions, failures)) for sid in range(args.sessions)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if saved_stderr is not None:
+        os.dup2(saved_stderr, 2)
+        os.close(saved_stderr)
+
+    memory = (tracemalloc.get_traced_memory()[0] - baseline) / max(1, len(sessions)) if args.memory else None
+    latencies = [v for r in results.values() for v in r["latencies"]]
+    back_latencies = [v for r in results.values() for v in r["back_latencies"]]
+    reruns = sum(r["reruns"] for r in results.values())
+    metrics = read_metrics(os.path.join(workdir, ".jifra_metrics.jsonl"))
+    outcomes = {}
+    for r in metrics:
+        outcomes[r.get("outcome")] = outcomes.get(r.get("outcome"), 0) + 1
+
+    report = {
+        "sessions": args.sessions,
+        "completed_sessions": len(results),
+        "failed_sessions": failures,
+        "generations": len(latencies),
+        "elapsed_s": round(elapsed, 2),
+        "e2e_p50_ms": round(percentile(latencies, 0.5), 1),
+        "e2e_p95_ms": round(percentile(latencies, 0.95), 1),
+        "e2e_p99_ms": round(percentile(latencies, 0.99), 1),
+        "reruns_per_s": round(reruns / elapsed, 1) if elapsed else 0,
+        "ui_errors": sum(r["errors"] for r in results.values()),
+        "api_calls": fake_gemini.stats["calls"],
+        "injected_429": fake_gemini.stats["throttled"],
+        "retries": sum(r.get("retries", 0) for r in metrics),
+        "output_tokens": sum(r.get("output_tokens", 0) for r in metrics),
+        "back_opened": len(back_latencies),
+        "back_open_p50_ms": round(percentile(back_latencies, 0.5), 1),
+        "outcomes": outcomes,
+        "memory_per_session_kb": round(memory / 1024, 1) if memory is not None else None,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>22}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Jifra 🗼 - プリフライトの効果測定
+=================================
+入力のサンプル（bench/traffic_sample.jsonl、1行1件の {"style", "lang", "text", "expect"}）に
+jifra.preflight をかけ、以下を計測する。
+
+- 判定ごとの件数（empty / passthrough / same / そのまま生成）と、API 呼び出しを省けた割合
+- expect（想定される判定。null はそのまま生成）との一致率と、外れた入力
+- 1件あたりの判定時間（µs、p50/p99）
+
+ネットワーク不要。例:
+    python bench/preflight_bench.py
+    python bench/preflight_bench.py my_traffic.jsonl --repeat 1000 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from jifra.preflight import preflight
+
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic_sample.jsonl")
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how many API calls the local preflight saves on a traffic sample")
+    parser.add_argument("path", nargs="?", default=SAMPLE_PATH, help="JSONL with style, lang, text and an optional expect label")
+    parser.add_argument("--repeat", type=int, default=200, help="timing iterations per input")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    counts = {"empty": 0, "passthrough": 0, "same": 0, "proceed": 0}
+    misses = []
+    timings = []
+    for row in rows:
+        style, lang, text = row["style"], row.get("lang"), row["text"]
+        pre = preflight(text, style, lang)
+        counts[pre.action or "proceed"] += 1
+        if "expect" in row and row["expect"] != pre.action:
+            misses.append({"text": text, "lang": lang, "expect": row["expect"], "got": pre.action, "detected": pre.lang})
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            preflight(text, style, lang)
+            timings.append((time.perf_counter() - started) * 1e6)
+
+    total = len(rows)
+    labelled = sum(1 for r in rows if "expect" in r)
+    # empty / passthrough は呼び出し自体がなくなる。same は確認を挟むので、翻訳先を変えるか取りやめた分だけ減る
+    saved = counts["empty"] + counts["passthrough"]
+    report = {
+        "inputs": total,
+        **counts,
+        "calls_saved": saved,
+        "calls_saved_pct": round(saved / total * 100, 1) if total else 0.0,
+        "calls_held_pct": round((saved + counts["same"]) / total * 100, 1) if total else 0.0,
+        "accuracy_pct": round((labelled - len(misses)) / labelled * 100, 1) if labelled else None,
+        "p50_us": round(percentile(timings, 50), 1),
+        "p99_us": round(percentile(timings, 99), 1),
+        "misses": misses,
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for key, value in report.items():
+            if key != "misses":
+                print(f"{key:>16}: {value}")
+        for m in misses:
+            print(f"  miss: {m['text']!r} ({m['lang']}) expect {m['expect']} got {m['got']} detected {m['detected']}")
+
+if __name__ == "__main__":
+    main()
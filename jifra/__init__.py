@@ -0,0 +1,17 @@
+"""
+Jifra 🗼 - 翻訳エンジン
+=======================
+app.py（Streamlit）・CLI（python -m jifra）・HTTP API（python -m jifra serve）の共通部分。
+Streamlit には依存しない。google.generativeai は最初の生成まで import しない。
+
+    from jifra import Config, Engine
+    engine = Engine(Config({"gemini_api_key": "..."}))
+    engine.translate_document("casual", 1, "fr", "こんにちは")
+"""
+
+from .config import Config
+from .engine import Engine
+from .parser import parse_result
+from .ratelimit import PRIORITY_BATCH, PRIORITY_FREE, PRIORITY_PRO
+
+__all__ = ["Config", "Engine", "parse_result", "PRIORITY_PRO", "PRIORITY_FREE", "PRIORITY_BATCH"]
@@ -0,0 +1,9 @@
+"""
+Jifra 🗼 - python -m jifra
+"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Jifra 🗼 - 翻訳キャッシュ（メモリ LRU + SQLite）と同一リクエストの合流（single-flight）
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .prompts import get_template
+
+def normalize_input(text):
+    # 全角/半角・空白の揺れを吸収（改行構造は維持）
+    text = unicodedata.normalize("NFKC", text)
+    return "\n".join(" ".join(line.split()) for line in text.strip().splitlines() if line.strip())
+
+def make_cache_key(input_text, style, level, lang, model_name, back=True):
+    # テンプレートのIDと版で区別する（結果に影響しないパラメータは含まれない）
+    template = get_template(style, level, lang, back)
+    payload = json.dumps([normalize_input(input_text), template.id, template.version, model_name], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class TranslationCache:
+    def __init__(self, path, memory_items, disk_items, ttl):
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> (value, created)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self.db.commit()
+        except sqlite3.Error:
+            # ディスクが使えない環境ではメモリ層のみで動作
+            self.db = None
+
+    def _remember(self, key, value, created):
+        self.memory[key] = (value, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            item = self.memory.get(key)
+            if item and now - item[1] < self.ttl:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return item[0]
+            self.memory.pop(key, None)
+
+            if self.db is not None:
+                try:
+                    row = self.db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+                    if row and now - row[1] < self.ttl:
+                        self.db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                        self.db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.stats["disk_hits"] += 1
+                        return row[0]
+                except sqlite3.Error:
+                    pass
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+            self.stats["writes"] += 1
+            if self.db is None:
+                return
+            try:
+                self.db.execute("INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)", (key, value, now, now))
+                # 一定回数ごとに期限切れ・上限超過分を削除
+                if self.stats["writes"] % 100 == 1:
+                    self.db.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+                    self.db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.disk_items,))
+                self.db.commit()
+            except sqlite3.Error:
+                pass
+
+    def snapshot(self):
+        with self.lock:
+            s = dict(self.stats)
+            s["memory_size"] = len(self.memory)
+        hits = s["memory_hits"] + s["disk_hits"]
+        s["hit_rate"] = hits / (hits + s["misses"]) if hits + s["misses"] else 0.0
+        return s
+
+class SingleFlight:
+    # 同じキーの呼び出しが実行中なら、新たに呼ばずにその結果（または例外）を待つ
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> {"done": Event, "result": ..., "error": ...}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"done": threading.Event(), "result": None, "error": None}
+                self.flights[key] = flight
+                self.stats["leaders"] += 1
+            else:
+                self.stats["followers"] += 1
+
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["result"], True
+
+        try:
+            flight["result"] = fn()
+        except BaseException as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight["done"].set()
+        return flight["result"], False
+
+    def snapshot(self):
+        with self.lock:
+            s = dict(self.stats)
+            s["in_flight"] = len(self.flights)
+        return s
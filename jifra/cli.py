@@ -0,0 +1,94 @@
+"""
+Jifra 🗼 - コマンドライン
+
+    python -m jifra translate notes.txt --style formal --lang en --format jsonl
+    echo "明日の会議は10時からです。" | python -m jifra translate --lang fr
+    python -m jifra serve --port 8765
+
+設定は .streamlit/secrets.toml（--secrets で変更）と環境変数 GEMINI_API_KEY / JIFRA_<名前> から読む。
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+from .engine import Engine
+from .prompts import LANG_NAMES
+from .ratelimit import PRIORITY_BATCH
+from .segments import batch_to_csv, read_segments
+
+def read_inputs(paths):
+    # ファイル（TXT は1行1件、CSV は text 列か1列目）、指定がなければ標準入力の各行
+    if not paths:
+        return [line.strip() for line in sys.stdin if line.strip()]
+    segments = []
+    for path in paths:
+        with open(path, "rb") as f:
+            segments.extend(read_segments(path, f.read()))
+    return segments
+
+def cmd_translate(engine, args):
+    lang = "+".join(LANG_NAMES) if args.lang == "all" else args.lang
+    lang = lang if args.style in ("casual", "formal") else None
+    segments = read_inputs(args.files)
+
+    # 入力順に出力する（長い行は分割して並列に翻訳される）
+    def work(text):
+        return engine.translate_document(args.style, args.level, lang, text, PRIORITY_BATCH, back=not args.no_back)
+
+    rows = []
+    out = sys.stdout
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency or engine.config.batch_concurrency)) as pool:
+        for no, (text, result) in enumerate(zip(segments, pool.map(work, segments)), 1):
+            row = {"no": no, "input": text, "output": (result["raw"] or "").strip(), "error": result["error"] or ""}
+            rows.append(row)
+            if args.format == "jsonl":
+                out.write(json.dumps({**row, "blocks": result["blocks"]}, ensure_ascii=False) + "\n")
+                out.flush()
+            elif args.format == "text":
+                # 1入力1行: 言語ごとに最初の候補をタブ区切りで出す
+                first = {}
+                for b in result["blocks"]:
+                    first.setdefault(b["label"], b["text"].replace("\n", " "))
+                out.write(("\t".join(first.values()) if first else f"# error: {row['error']}") + "\n")
+                out.flush()
+    if args.format == "csv":
+        out.buffer.write(batch_to_csv(rows))
+    return 1 if any(r["error"] for r in rows) else 0
+
+def cmd_serve(engine, args):
+    from .server import serve
+    server = serve(engine, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Jifra API on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="jifra", description="Jifra translation engine")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="secrets.toml to read settings from")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("translate", help="translate each line of stdin or the given TXT/CSV files")
+    p.add_argument("files", nargs="*")
+    p.add_argument("--style", choices=["casual", "formal", "sns", "prompt"], default="casual")
+    p.add_argument("--lang", choices=[*LANG_NAMES, "all"], default="fr")
+    p.add_argument("--level", type=int, choices=[1, 2, 3], default=1, help="prompt level (prompt style only)")
+    p.add_argument("--format", choices=["jsonl", "csv", "text"], default="jsonl")
+    p.add_argument("--concurrency", type=int, default=None)
+    p.add_argument("--no-back", action="store_true", help="skip Japanese back-translations (about half the output tokens)")
+
+    p = sub.add_parser("serve", help="run the local HTTP API")
+    p.add_argument("--host", default=None)
+    p.add_argument("--port", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    engine = Engine(Config.load(args.secrets))
+    return {"translate": cmd_translate, "serve": cmd_serve}[args.command](engine, args)
@@ -0,0 +1,93 @@
+"""
+Jifra 🗼 - エンジンの設定
+"""
+
+import os
+
+class Config:
+    # 既定値。Streamlit では st.secrets、CLI / HTTP API では secrets.toml と環境変数（JIFRA_<名前>）で上書きする
+    gemini_api_key = None
+
+    # キャッシュ
+    cache_path = ".jifra_cache.sqlite3"
+    cache_memory_items = 512
+    cache_disk_items = 20000
+    cache_ttl_sec = 7 * 24 * 3600
+
+    # レート制限（Gemini のクォータに合わせる）
+    rate_rpm = 15
+    rate_tpm = 1000000
+    rate_aging_sec = 10.0
+
+    # モデル選択の保存先と再検証間隔
+    model_state_path = ".jifra_models.json"
+    model_refresh_sec = 24 * 3600
+
+    # 複数モデルの振り分け（遅い応答へのヘッジ・429 時の切り替え）
+    router_models = 2
+    router_window = 200
+    router_hedge_min_sec = 1.0
+    router_hedge_default_sec = 8.0
+    router_cooldown_sec = 30.0
+    router_workers = 128  # ジョブ・バッチ・HTTP の全呼び出しとヘッジ分（job_workers より十分多く）
+
+    # 1回の生成の出力上限（モードごとの値を入力の長さに合わせて広げる時の天井。モデルの上限に合わせる）
+    max_output_tokens = 8192
+
+    # 履歴・計測ログ
+    history_path = ".jifra_history.sqlite3"
+    metrics_path = ".jifra_metrics.jsonl"
+    metrics_max_bytes = 5 * 1024 * 1024
+    metrics_backups = 3
+    metrics_window = 5000
+
+    # バッチ・長文の分割翻訳（この文字数を超える入力は段落・文単位に分けて並列に翻訳）
+    batch_concurrency = 4
+    long_input_chars = 1500
+    chunk_chars = 600
+    chunk_concurrency = 4
+
+    # 翻訳メモリ（しきい値は文字 bigram の Jaccard 係数）
+    # 索引は全利用者の合計が memory_budget_mb を超えるか memory_idle_sec 使われなかった利用者から捨てる
+    memory_path = ".jifra_memory.sqlite3"
+    memory_threshold = 0.8
+    memory_user_items = 2000
+    memory_budget_mb = 64
+    memory_idle_sec = 1800
+
+    # バックグラウンド生成
+    job_workers = 32
+    job_keep_sec = 600
+
+    # HTTP API（api_token を設定すると Authorization: Bearer が必要）
+    http_host = "127.0.0.1"
+    http_port = 8765
+    api_token = None
+
+    def __init__(self, values=None):
+        # values は dict や st.secrets のようなマッピング。知っているキーだけを既定値の型に合わせて取り込む
+        values = values or {}
+        for key, default in vars(Config).items():
+            if key.startswith("_") or callable(default) or isinstance(default, classmethod) or key not in values:
+                continue
+            value = values[key]
+            if isinstance(default, (int, float)) and not isinstance(value, type(default)):
+                value = type(default)(value)
+            setattr(self, key, value)
+
+    @classmethod
+    def load(cls, path=".streamlit/secrets.toml", environ=None):
+        # CLI / HTTP API 用: Streamlit と同じ secrets.toml を読み、環境変数で上書きする
+        values = {}
+        if path and os.path.exists(path):
+            import tomllib
+            with open(path, "rb") as f:
+                values.update(tomllib.load(f))
+        environ = os.environ if environ is None else environ
+        if environ.get("GEMINI_API_KEY"):
+            values["gemini_api_key"] = environ["GEMINI_API_KEY"]
+        for key in vars(cls):
+            name = f"JIFRA_{key.upper()}"
+            if name in environ:
+                values[key] = environ[name]
+        return cls(values)
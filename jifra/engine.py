@@ -0,0 +1,272 @@
+"""
+Jifra 🗼 - 翻訳エンジン（Streamlit 非依存）
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .cache import SingleFlight, TranslationCache, make_cache_key
+from .config import Config
+from .history import HistoryStore
+from .jobs import JobQueue
+from .memory import TranslationMemory
+from .metrics import Metrics
+from .models import LazyModel, ModelRouter, call_api, call_api_stream, candidate_models, load_model_state, revalidate_model
+from .parser import assemble_chunks, extract_history_texts, parse_back, parse_result
+from .preflight import preflight
+from .prompts import build_prompt, get_template, is_multi_lang, output_limit, resolve_back
+from .ratelimit import PRIORITY_BATCH, PRIORITY_FREE, RateLimiter, estimate_tokens
+from .segments import split_chunks
+
+class Engine:
+    # 1プロセスに1つ作り、全スレッド・全利用者で共有する（レート制限・モデル・キャッシュ・履歴など）
+    # 利用者ごとの情報（履歴・翻訳メモリ）は user を引数で受け取る
+    def __init__(self, config=None):
+        self.config = c = config or Config()
+        self.limiter = RateLimiter(c.rate_rpm, c.rate_tpm, c.rate_aging_sec)
+        self.cache = TranslationCache(c.cache_path, c.cache_memory_items, c.cache_disk_items, c.cache_ttl_sec)
+        self.singleflight = SingleFlight()
+        self.metrics = Metrics(c.metrics_path, c.metrics_max_bytes, c.metrics_backups, c.metrics_window)
+        self.history = HistoryStore(c.history_path)
+        self.memory = TranslationMemory(c.memory_path, c.memory_user_items, c.memory_budget_mb * 1024 * 1024, c.memory_idle_sec)
+        self.jobs = JobQueue(c.job_workers, c.job_keep_sec)
+
+        # 保存済みの選択ですぐに起動し、古ければバックグラウンドで list_models を再検証（起動後も翻訳のたびに確認）
+        state = load_model_state(c.model_state_path)
+        self.model_lock = threading.Lock()
+        self.model_updated = state.get("updated", 0) if state else 0
+        self.model_refreshing = False
+        self.model = ModelRouter([LazyModel(n, c.gemini_api_key) for n in candidate_models(state, c.router_models)],
+                                 c.router_window, c.router_hedge_min_sec, c.router_hedge_default_sec, c.router_cooldown_sec,
+                                 try_acquire=lambda contents: self.limiter.try_acquire(estimate_tokens(str(contents))),
+                                 factory=lambda name: LazyModel(name, c.gemini_api_key), workers=c.router_workers)
+        self.refresh_model()
+
+    def refresh_model(self):
+        # モデルの選択が model_refresh_sec より古ければ、バックグラウンドで1本だけ再検証する（待たない）
+        c = self.config
+        with self.model_lock:
+            if self.model_refreshing or time.time() - self.model_updated <= c.model_refresh_sec:
+                return
+            self.model_refreshing = True
+        threading.Thread(target=self._revalidate_model, daemon=True).start()
+
+    def _revalidate_model(self):
+        c = self.config
+        try:
+            revalidate_model(self.model, c.gemini_api_key, c.model_state_path, c.router_models)
+        finally:
+            # 失敗した場合も次の確認は model_refresh_sec 後（一覧取得を繰り返さない）
+            with self.model_lock:
+                self.model_updated = time.time()
+                self.model_refreshing = False
+
+    def translate(self, style, level, lang, input_text, priority=PRIORITY_FREE, on_chunk=None, back=True, check=None):
+        # キャッシュ → single-flight → call_api の順で1件翻訳する
+        # on_chunk を渡すとストリーミングで取得（合流した側には最終結果のみ返る）
+        # back=False は逆翻訳なしのテンプレートで生成する（キャッシュキーも別）
+        # check は応答を検証する関数（読めなければエラー文を返す）。エラーになった応答はキャッシュしない
+        self.refresh_model()
+        started = time.perf_counter()
+        stats = {}
+        model_name = self.model.name
+        template = get_template(style, level, lang, back)
+        record = {"event": "request", "style": style, "level": level if style == "prompt" else None, "lang": lang, "model": model_name, "priority": priority, "back": back}
+        cache_key = make_cache_key(input_text, style, level, lang, model_name, back)
+        res = self.cache.get(cache_key)
+        if res is not None:
+            self.metrics.record(record, outcome="cache", latency_ms=(time.perf_counter() - started) * 1000)
+            return res, None
+
+        def fetch():
+            prompt = build_prompt(template, input_text)
+            mode_model = self.model.bind(template)
+            # 出力の上限は入力の長さに合わせて広げる（打ち切られた応答はエラーになり、キャッシュしない）
+            generation_config = {"max_output_tokens": output_limit(template, input_text, self.config.max_output_tokens)}
+            if on_chunk and not is_multi_lang(lang):
+                res, err = call_api_stream(mode_model, prompt, on_chunk, self.limiter, priority, generation_config, stats=stats)
+            else:
+                # JSON（All targets）は途中で分解できないのでストリーミングしない
+                res, err = call_api(mode_model, prompt, self.limiter, priority, generation_config, stats=stats)
+            if not err and check:
+                err = check(res)
+                res = None if err else res
+            # 合流待ちが解放される前にキャッシュへ入れておく
+            if not err:
+                self.cache.put(cache_key, res)
+            return res, err
+
+        (res, err), shared = self.singleflight.do(cache_key, fetch)
+        if shared:
+            outcome = "coalesced"
+        elif not err:
+            outcome = "ok"
+        else:
+            outcome = "throttled" if "429" in err else "error"
+        self.metrics.record(record, outcome=outcome, latency_ms=(time.perf_counter() - started) * 1000, error=err, **stats)
+        return res, err
+
+    def run_batch(self, style, level, lang, segments, concurrency=None, on_progress=None, priority=PRIORITY_BATCH, cancel=None, back=True):
+        results = [None] * len(segments)
+
+        def work(i):
+            if cancel is not None and cancel.is_set():
+                # 取り消し後はまだ始まっていない行を呼ばない
+                return i, None, "Cancelled"
+            try:
+                res, err = self.translate(style, level, lang, segments[i], priority, back=back)
+            except Exception as e:
+                # 1行の失敗でバッチ全体を止めない
+                res, err = None, str(e)
+            return i, res, err
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency or self.config.batch_concurrency)) as pool:
+            futures = [pool.submit(work, i) for i in range(len(segments))]
+            for done, future in enumerate(as_completed(futures), 1):
+                i, res, err = future.result()
+                results[i] = {"no": i + 1, "input": segments[i], "output": (res or "").strip(), "error": err or ""}
+                if on_progress:
+                    on_progress(done, len(segments), results[i])
+        return results
+
+    def chunks_for(self, style, input_text):
+        # 長文（翻訳モードのみ）は段落・文単位に分割する。分割しない場合は空リスト
+        if style not in ("casual", "formal") or len(input_text) <= self.config.long_input_chars:
+            return []
+        chunks = split_chunks(input_text, self.config.chunk_chars)
+        return chunks if len(chunks) > 1 else []
+
+    def preflight(self, style, level, lang, input_text):
+        # API を呼ぶ前のローカル判定（数 µs、通信なし）。判定が出たものは計測ログに残す
+        started = time.perf_counter()
+        pre = preflight(input_text, style, lang)
+        if pre.action:
+            self.metrics.record({"event": "preflight", "style": style, "level": level if style == "prompt" else None, "lang": lang},
+                                action=pre.action, detected=pre.lang, latency_us=round((time.perf_counter() - started) * 1e6))
+        return pre
+
+    def translate_document(self, style, level, lang, input_text, priority=PRIORITY_FREE, back=True):
+        # 同期版（CLI・HTTP API 用）: 長文は分割して並列に翻訳し、表示用のブロックも返す
+        # 訳すものがない入力はそのまま返す。翻訳先と同じ言語は確認する人がいないので訳し、判定だけを添える
+        back = resolve_back(style, back)
+        pre = self.preflight(style, level, lang, input_text)
+        if pre.action in ("empty", "passthrough"):
+            text = input_text.strip()
+            return {"raw": text, "blocks": [{"text": text, "back": "", "label": ""}] if text else [], "error": None, "preflight": pre._asdict()}
+        result = self._translate_document(style, level, lang, input_text, priority, back)
+        if pre.action:
+            result["preflight"] = pre._asdict()
+        return result
+
+    def _translate_document(self, style, level, lang, input_text, priority, back):
+        chunks = self.chunks_for(style, input_text)
+        if chunks:
+            rows = self.run_batch(style, level, lang, chunks, self.config.chunk_concurrency, priority=priority, back=back)
+            failed = [r for r in rows if r["error"]]
+            if failed:
+                return {"raw": None, "blocks": [], "error": f"{len(failed)} / {len(rows)} parts failed: {failed[0]['error']}"}
+            raws = [r["output"] for r in rows]
+            return {"raw": "\n\n".join(raws), "chunks": raws, "blocks": assemble_chunks(raws, lang, back), "error": None}
+        res, err = self.translate(style, level, lang, input_text, priority, back=back)
+        if err:
+            return {"raw": None, "blocks": [], "error": err}
+        return {"raw": res, "blocks": parse_result(res, lang, back), "error": None}
+
+    def back_translate(self, texts, priority=PRIORITY_FREE):
+        # 逆翻訳なしで生成した結果の各案を逆翻訳する（キャッシュ・合流は translate と共通）
+        # 長い文書でも出力が上限に収まるよう、chunk_chars 程度ずつまとめて並列に呼ぶ。読めない応答は表示せずエラーにする
+        batches = []
+        size = 0
+        for text in texts:
+            if batches and size + len(text) <= self.config.chunk_chars:
+                batches[-1].append(text)
+                size += len(text)
+            else:
+                batches.append([text])
+                size = len(text)
+
+        def work(batch):
+            def check(res):
+                return None if parse_back(res, len(batch)) is not None else "Could not read the back-translations"
+            res, err = self.translate("back", None, None, json.dumps(batch, ensure_ascii=False), priority, check=check)
+            return (None, err) if err else (parse_back(res, len(batch)), None)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(batches), self.config.chunk_concurrency))) as pool:
+            results = list(pool.map(work, batches))
+        failed = [err for _, err in results if err]
+        if failed:
+            return None, failed[0]
+        return [b for backs, _ in results for b in backs], None
+
+    # --- 履歴・翻訳メモリ（利用者別） ---
+    def add_history(self, user, result, source, style, lang, limit, chunks=None, back=True):
+        if chunks:
+            # 分割翻訳は連結した全文だけを残す
+            texts = [b["text"] for b in assemble_chunks(chunks, lang, back)]
+        elif is_multi_lang(lang):
+            texts = [b["text"] for b in parse_result(result, lang, back)]
+        else:
+            texts = extract_history_texts(result)
+        self.history.add(user, source, result, texts, style, lang, limit)
+
+    def memory_key(self, style, level, lang, back=True):
+        # テンプレートが同じ（同じ指示・出力形式）結果どうしだけを比べる
+        template = get_template(style, level, lang, back)
+        return f"{template.id}@{template.version}"
+
+    def recall(self, user, style, level, lang, input_text, back=True):
+        # 似た入力の過去結果を探す（見つかれば API を呼ばない）
+        started = time.perf_counter()
+        match = self.memory.lookup(user, self.memory_key(style, level, lang, back), input_text, self.config.memory_threshold)
+        if match:
+            record = {"event": "request", "style": style, "level": level if style == "prompt" else None, "lang": lang}
+            self.metrics.record(record, outcome="memory", similarity=round(match["score"] * 100), latency_ms=(time.perf_counter() - started) * 1000)
+        return match
+
+    def remember(self, user, style, level, lang, segments, back=True):
+        # モデルで生成した (入力, 結果) だけを登録する（メモリから出した結果は登録しない）
+        key = self.memory_key(style, level, lang, back)
+        for source, raw in segments:
+            self.memory.add(user, key, source, raw)
+
+    # --- バックグラウンド生成（jobs.submit に渡す） ---
+    def generate_text(self, job, user, style, level, lang, input_text, priority, history_limit, streaming, back=True):
+        back = resolve_back(style, back)
+        on_chunk = job.partial.append if streaming else None
+        res, err = self.translate(style, level, lang, input_text, priority, on_chunk, back)
+        job.check()
+        if err:
+            raise RuntimeError(err)
+        self.add_history(user, res, input_text, style, lang, history_limit, back=back)
+        self.remember(user, style, level, lang, [(input_text, res)], back)
+        return {"raw": res, "style": style, "lang": lang, "back": back}
+
+    def generate_long(self, job, user, style, level, lang, chunks, priority, history_limit, source, use_memory, back=True):
+        # 翻訳メモリにあるチャンクはすぐに埋め、残りだけを並列に翻訳する（終わったものから job.parts に入る）
+        back = resolve_back(style, back)
+        matches = {}
+        for i, chunk in enumerate(chunks):
+            match = self.recall(user, style, level, lang, chunk, back) if use_memory else None
+            if match:
+                matches[i] = match
+                job.parts[i] = {"no": i + 1, "input": chunk, "output": match["raw"], "error": ""}
+        pending = [i for i in range(len(chunks)) if i not in matches]
+        def on_progress(done, total, row):
+            job.parts[pending[row["no"] - 1]] = row
+        self.run_batch(style, level, lang, [chunks[i] for i in pending], self.config.chunk_concurrency, on_progress, priority, job.cancelled, back)
+        job.check()
+        failed = [r for r in job.parts if r["error"]]
+        if failed:
+            raise RuntimeError(f"{len(failed)} / {len(chunks)} parts failed: {failed[0]['error']}")
+
+        # 結果には連結前のチャンクだけを持たせる（全文は表示時に連結する）
+        raws = [r["output"] for r in job.parts]
+        res = "\n\n".join(raws)
+        result = {"chunks": raws, "style": style, "lang": lang, "back": back}
+        if matches:
+            result["memory"] = {"score": min(m["score"] for m in matches.values()), "source": "", "parts": len(matches)}
+        self.add_history(user, res, source, style, lang, history_limit, raws, back)
+        self.remember(user, style, level, lang, [(chunks[i], job.parts[i]["output"]) for i in pending], back)
+        return result
@@ -0,0 +1,106 @@
+"""
+Jifra 🗼 - ユーザー別の永続履歴（SQLite + FTS5）
+"""
+
+import sqlite3
+import threading
+import time
+
+class HistoryStore:
+    # ユーザー別の永続履歴（SQLite）
+    # 生成結果は results に1回だけ保存し、履歴の各行はそれを参照する
+    # 検索は FTS5 (trigram) の全文索引、使えない環境では LIKE で代用
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY, user TEXT NOT NULL, source TEXT NOT NULL, raw TEXT NOT NULL,
+                style TEXT, lang TEXT, created REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY, user TEXT NOT NULL, result_id INTEGER NOT NULL,
+                text TEXT NOT NULL, pinned INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS history_user ON history (user, pinned DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS history_result ON history (result_id);
+        """)
+        try:
+            self.db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(text, source, tokenize='trigram');
+                CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, text, source)
+                    VALUES (new.id, new.text, (SELECT source FROM results WHERE id = new.result_id));
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                    DELETE FROM history_fts WHERE rowid = old.id;
+                END;
+            """)
+            self.fts = True
+        except sqlite3.Error:
+            self.fts = False
+        self.db.commit()
+
+    def add(self, user, source, raw, texts, style, lang, limit):
+        now = time.time()
+        with self.lock, self.db:
+            result_id = self.db.execute(
+                "INSERT INTO results (user, source, raw, style, lang, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (user, source, raw, style, lang, now)).lastrowid
+            # 後から入れた行ほど上に表示されるので、最後のバリエーションから入れる
+            self.db.executemany(
+                "INSERT INTO history (user, result_id, text, created) VALUES (?, ?, ?, ?)",
+                [(user, result_id, t, now) for t in reversed(texts)])
+            # ピン留め優先で上限件数を超えた分を削除（今追加した結果は消さない）
+            self.db.execute(
+                "DELETE FROM history WHERE id IN (SELECT id FROM history WHERE user = ? AND result_id != ? "
+                "ORDER BY pinned DESC, id DESC LIMIT -1 OFFSET ?)",
+                (user, result_id, max(0, limit - len(texts))))
+            self.db.execute(
+                "DELETE FROM results WHERE user = ? AND id NOT IN (SELECT result_id FROM history WHERE user = ?)",
+                (user, user))
+
+    def page(self, user, query="", offset=0, limit=20):
+        # limit + 1 件取得して次ページの有無を判定する
+        query = query.strip()
+        with self.lock:
+            if not query:
+                rows = self.db.execute(
+                    "SELECT id, text, pinned FROM history WHERE user = ? ORDER BY pinned DESC, id DESC LIMIT ? OFFSET ?",
+                    (user, limit + 1, offset)).fetchall()
+            elif self.fts and len(query) >= 3:
+                rows = self.db.execute(
+                    "SELECT h.id, h.text, h.pinned FROM history_fts f JOIN history h ON h.id = f.rowid "
+                    "WHERE history_fts MATCH ? AND h.user = ? ORDER BY h.pinned DESC, h.id DESC LIMIT ? OFFSET ?",
+                    ('"' + query.replace('"', '""') + '"', user, limit + 1, offset)).fetchall()
+            else:
+                like = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                rows = self.db.execute(
+                    "SELECT h.id, h.text, h.pinned FROM history h JOIN results r ON r.id = h.result_id "
+                    "WHERE h.user = ? AND (h.text LIKE ? ESCAPE '\\' OR r.source LIKE ? ESCAPE '\\') "
+                    "ORDER BY h.pinned DESC, h.id DESC LIMIT ? OFFSET ?",
+                    (user, like, like, limit + 1, offset)).fetchall()
+        entries = [{"id": r[0], "text": r[1], "pinned": bool(r[2])} for r in rows[:limit]]
+        return entries, len(rows) > limit
+
+    def latest(self, user, limit=1):
+        # ピン留めに関係なく新しい順（FREE の表示用）
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, text, pinned FROM history WHERE user = ? ORDER BY id DESC LIMIT ?", (user, limit)).fetchall()
+        return [{"id": r[0], "text": r[1], "pinned": bool(r[2])} for r in rows]
+
+    def pinned_count(self, user):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM history WHERE user = ? AND pinned = 1", (user,)).fetchone()[0]
+
+    def set_pinned(self, user, entry_id, pinned):
+        with self.lock, self.db:
+            self.db.execute("UPDATE history SET pinned = ? WHERE user = ? AND id = ?", (int(pinned), user, entry_id))
+
+    def clear(self, user):
+        # ピン留め以外を削除
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM history WHERE user = ? AND pinned = 0", (user,))
+            self.db.execute(
+                "DELETE FROM results WHERE user = ? AND id NOT IN (SELECT result_id FROM history WHERE user = ?)",
+                (user, user))
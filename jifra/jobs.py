@@ -0,0 +1,103 @@
+"""
+Jifra 🗼 - バックグラウンド生成ジョブ（全利用者で共有するワーカー）
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    # 1件の生成。ワーカーが途中経過（ストリーミング本文・完了したチャンク）を書き込み、呼び出し側が読む
+    def __init__(self, job_id, total, lang, back=True):
+        self.id = job_id
+        self.lang = lang
+        self.back = back  # False なら逆翻訳なしのテンプレート（途中経過も VARIATION_SEPARATOR の行で案を区切って表示する）
+        self.status = "queued"  # queued → running → done / error / cancelled
+        self.cancelled = threading.Event()
+        self.partial = []  # ストリーミングで受信した本文
+        self.parts = [None] * total  # 分割翻訳の完了したチャンク
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+class JobQueue:
+    # 呼び出し側は投入だけして戻り、status / partial / parts を見に来て完了を受け取る（Streamlit ではフラグメントの定期実行）
+    # 取り消しは協調的: 開始前なら API を呼ばず、実行中の呼び出しは最後まで走って共有キャッシュにだけ入る
+    def __init__(self, workers, keep_sec):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="jifra-job")
+        self.keep_sec = keep_sec
+        self.lock = threading.Lock()
+        self.jobs = {}  # id -> Job
+        self.stats = {"submitted": 0, "done": 0, "error": 0, "cancelled": 0}
+
+    def submit(self, fn, total=0, lang=None, back=True):
+        job = Job(uuid.uuid4().hex[:12], total, lang, back)
+
+        def run():
+            try:
+                job.check()
+                job.status = "running"
+                job.result = fn(job)
+                job.check()
+                job.status = "done"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "error"
+            job.finished = time.time()
+            with self.lock:
+                self.stats[job.status] += 1
+
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+            self.stats["submitted"] += 1
+        job.future = self.pool.submit(run)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def forget(self, job_id):
+        # 結果を受け取ったジョブはすぐに手放す（keep_sec まで結果の複製を持ち続けない）
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.finished:
+                del self.jobs[job_id]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancelled.set()
+        if job.future.cancel():
+            job.status = "cancelled"
+            job.finished = time.time()
+            with self.lock:
+                self.stats["cancelled"] += 1
+        return True
+
+    def _prune(self):
+        # 終わってから keep_sec 経ったジョブは忘れる（取りに来なかった結果も含む）
+        cutoff = time.time() - self.keep_sec
+        for job_id in [i for i, j in self.jobs.items() if j.finished and j.finished < cutoff]:
+            del self.jobs[job_id]
+
+    def snapshot(self):
+        with self.lock:
+            s = dict(self.stats)
+            s["queued"] = sum(1 for j in self.jobs.values() if j.status == "queued")
+            s["running"] = sum(1 for j in self.jobs.values() if j.status == "running")
+        return s
@@ -0,0 +1,222 @@
+"""
+Jifra 🗼 - 翻訳メモリ（似た入力の過去結果を MinHash + LSH で探す）
+"""
+
+import random
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from collections import OrderedDict, namedtuple
+
+from .cache import normalize_input
+
+MERSENNE = (1 << 61) - 1
+
+# 索引の1件。shingles は bigram の crc32 を並べた array（本文と結果は SQLite にだけ置き、ヒットした時に読む）
+MemoryEntry = namedtuple("MemoryEntry", "key shingles bands")
+
+def memory_shingles(text):
+    # 句読点・記号・絵文字・空白の違いは無視し、小文字にした文字 bigram の集合で比べる
+    chars = "".join(c for c in unicodedata.normalize("NFKC", text).lower() if unicodedata.category(c)[0] in "LN")
+    if len(chars) < 2:
+        return frozenset([chars]) if chars else frozenset()
+    return frozenset(chars[i:i + 2] for i in range(len(chars) - 1))
+
+def shingle_hashes(shingles):
+    # 保存するのでプロセスをまたいで同じ値になるハッシュを使う（hash() は起動ごとに変わる）
+    return array("I", sorted({zlib.crc32(s.encode("utf-8")) for s in shingles}))
+
+class UserIndex:
+    # 1ユーザー分の索引。バケットの値は1件なら id そのもの、2件以上なら id のタプル（set より小さい）
+    __slots__ = ("entries", "buckets", "bytes", "used")
+
+    def __init__(self):
+        self.entries = {}  # id -> MemoryEntry
+        self.buckets = {}  # hash((key, band, band_hash)) -> id | (id, ...)
+        self.bytes = 0
+        self.used = time.time()
+
+    def ids(self, bucket):
+        ids = self.buckets.get(bucket, ())
+        return (ids,) if isinstance(ids, int) else ids
+
+class TranslationMemory:
+    # ユーザー別の翻訳メモリ（入力 → 生成結果）。SQLite に保存し、索引はユーザーごとに初回参照時に作る
+    # MinHash + LSH で候補を絞り込み、候補だけ Jaccard 係数を正確に計算する
+    # 索引の合計が budget_bytes を超えるか idle_sec 使われなかったユーザーは、古い順に索引を捨てる（次の参照で読み直す）
+    BANDS, ROWS = 21, 3
+    # 1件あたりの索引のおおよその大きさ（エントリ・id・バケット。shingles と bands は別に数える）
+    ENTRY_BYTES = 64 + 32 + 100 + BANDS * 65
+
+    def __init__(self, path, max_items, budget_bytes=64 * 1024 * 1024, idle_sec=1800):
+        self.max_items = max_items
+        self.budget_bytes = budget_bytes
+        self.idle_sec = idle_sec
+        self.lock = threading.Lock()
+        rng = random.Random(0)
+        self.perms = [(rng.randrange(1, MERSENNE), rng.randrange(MERSENNE)) for _ in range(self.BANDS * self.ROWS)]
+        self.users = OrderedDict()  # user -> UserIndex（最近使った順）
+        self.bytes = 0
+        self.stats = {"lookups": 0, "hits": 0, "evicted": 0}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS memory (
+                id INTEGER PRIMARY KEY, user TEXT NOT NULL, key TEXT NOT NULL,
+                source TEXT NOT NULL, raw TEXT NOT NULL, created REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS memory_user ON memory (user, id);
+        """)
+        # 署名（band ハッシュ）も保存し、索引を捨てたユーザーの読み直しで計算し直さない
+        try:
+            self.db.execute("ALTER TABLE memory ADD COLUMN bands BLOB")
+        except sqlite3.OperationalError:
+            pass
+        self.db.commit()
+
+    def _bands(self, hashes):
+        sig = [min((a * h + b) % MERSENNE for h in hashes) for a, b in self.perms]
+        return array("q", [((sig[i] * 31 + sig[i + 1]) * 31 + sig[i + 2]) % MERSENNE for i in range(0, len(sig), self.ROWS)])
+
+    def _index(self, index, entry_id, key, shingles, bands):
+        entry = MemoryEntry(key, shingles, bands)
+        index.entries[entry_id] = entry
+        for band, h in enumerate(bands):
+            bucket = hash((key, band, h))
+            ids = index.buckets.get(bucket)
+            index.buckets[bucket] = entry_id if ids is None else index.ids(bucket) + (entry_id,)
+        size = self.ENTRY_BYTES + sys.getsizeof(shingles) + sys.getsizeof(bands)
+        index.bytes += size
+        self.bytes += size
+
+    def _unindex(self, index, entry_id):
+        entry = index.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band, h in enumerate(entry.bands):
+            bucket = hash((entry.key, band, h))
+            ids = tuple(i for i in index.ids(bucket) if i != entry_id)
+            if ids:
+                index.buckets[bucket] = ids[0] if len(ids) == 1 else ids
+            else:
+                index.buckets.pop(bucket, None)
+        size = self.ENTRY_BYTES + sys.getsizeof(entry.shingles) + sys.getsizeof(entry.bands)
+        index.bytes -= size
+        self.bytes -= size
+
+    def _load(self, user):
+        index = self.users.get(user)
+        if index is None:
+            index = self.users[user] = UserIndex()
+            missing = []
+            for entry_id, key, source, blob in self.db.execute("SELECT id, key, source, bands FROM memory WHERE user = ? ORDER BY id", (user,)):
+                shingles = shingle_hashes(memory_shingles(source))
+                if not shingles:
+                    continue
+                if blob is None:
+                    # 署名を保存する前に登録されたもの
+                    bands = self._bands(shingles)
+                    missing.append((bands.tobytes(), entry_id))
+                else:
+                    bands = array("q")
+                    bands.frombytes(blob)
+                self._index(index, entry_id, key, shingles, bands)
+            if missing:
+                with self.db:
+                    self.db.executemany("UPDATE memory SET bands = ? WHERE id = ?", missing)
+        index.used = time.time()
+        self.users.move_to_end(user)
+        self._evict(user)
+        return index
+
+    def _evict(self, keep):
+        # 古い順に、idle_sec を過ぎたユーザーと予算を超えた分の索引を捨てる（使用中のユーザーは残す）
+        cutoff = time.time() - self.idle_sec
+        for user, index in list(self.users.items()):
+            if user == keep:
+                continue
+            if index.used >= cutoff and self.bytes <= self.budget_bytes:
+                break
+            del self.users[user]
+            self.bytes -= index.bytes
+            self.stats["evicted"] += 1
+
+    def lookup(self, user, key, source, threshold):
+        hashes = shingle_hashes(memory_shingles(source))
+        if not hashes:
+            return None
+        bands = self._bands(hashes)
+        shingles = set(hashes)
+        with self.lock:
+            index = self._load(user)
+            self.stats["lookups"] += 1
+            candidates = set()
+            for band, h in enumerate(bands):
+                candidates.update(index.ids(hash((key, band, h))))
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = index.entries[entry_id]
+                if entry.key != key:
+                    continue
+                common = len(shingles.intersection(entry.shingles))
+                score = common / (len(shingles) + len(entry.shingles) - common)
+                # 同点なら新しい結果を優先
+                if score >= threshold and (best_id is None or (score, entry_id) > (best_score, best_id)):
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                return None
+            self.stats["hits"] += 1
+            src, raw = self.db.execute("SELECT source, raw FROM memory WHERE id = ?", (best_id,)).fetchone()
+        return {"id": best_id, "score": best_score, "source": src, "raw": raw}
+
+    def add(self, user, key, source, raw):
+        shingles = shingle_hashes(memory_shingles(source))
+        if not shingles:
+            return
+        bands = self._bands(shingles)
+        norm = normalize_input(source)
+        with self.lock, self.db:
+            index = self._load(user)
+            # 同じ入力の古い結果は置き換える（同じ shingle 集合なら band 0 のバケットも同じ）
+            same = [i for i in index.ids(hash((key, 0, bands[0])))
+                    if index.entries[i].key == key and index.entries[i].shingles == shingles]
+            same = [i for i in same
+                    if normalize_input(self.db.execute("SELECT source FROM memory WHERE id = ?", (i,)).fetchone()[0]) == norm]
+            for entry_id in same:
+                self._unindex(index, entry_id)
+            if same:
+                self.db.executemany("DELETE FROM memory WHERE id = ?", [(i,) for i in same])
+            entry_id = self.db.execute(
+                "INSERT INTO memory (user, key, source, raw, created, bands) VALUES (?, ?, ?, ?, ?, ?)",
+                (user, key, source, raw, time.time(), bands.tobytes())).lastrowid
+            self._index(index, entry_id, key, shingles, bands)
+            # 上限を超えた古いものから削除
+            old = [r[0] for r in self.db.execute(
+                "SELECT id FROM memory WHERE user = ? ORDER BY id DESC LIMIT -1 OFFSET ?", (user, self.max_items))]
+            for i in old:
+                self._unindex(index, i)
+            self.db.executemany("DELETE FROM memory WHERE id = ?", [(i,) for i in old])
+            self._evict(user)
+
+    def clear(self, user):
+        with self.lock, self.db:
+            index = self.users.pop(user, None)
+            if index is not None:
+                self.bytes -= index.bytes
+            self.db.execute("DELETE FROM memory WHERE user = ?", (user,))
+
+    def footprint(self, user):
+        # そのユーザーの索引のおおよそのバイト数（読み込まれていなければ 0）
+        with self.lock:
+            index = self.users.get(user)
+            return index.bytes if index is not None else 0
+
+    def snapshot(self):
+        with self.lock:
+            lookups, hits = self.stats["lookups"], self.stats["hits"]
+            return {"lookups": lookups, "hits": hits, "hit_rate": hits / lookups if lookups else 0.0,
+                    "entries": sum(len(i.entries) for i in self.users.values()), "users": len(self.users),
+                    "bytes": self.bytes, "budget_bytes": self.budget_bytes, "evicted": self.stats["evicted"]}
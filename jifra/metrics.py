@@ -0,0 +1,96 @@
+"""
+Jifra 🗼 - リクエスト計測（JSONL ログ + 直近分の集計）
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+class Metrics:
+    # 1リクエスト1行のJSONLをローテーションしながら書き出し、直近分をメモリで集計する
+    # 画面の再描画ごとの計測（パース時間など）はリクエストの集計を押し出さないよう、名前別に別の窓で持つ（ログには書かない）
+    def __init__(self, path, max_bytes, backups, window):
+        self.lock = threading.Lock()
+        self.records = deque(maxlen=window)
+        self.window = window
+        self.timings = {}  # 名前 -> deque[ms]
+        # 再起動後も直近の集計が見えるよう、既存ログの末尾を読み込む
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in deque(f, maxlen=window):
+                    try:
+                        self.records.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except OSError:
+            pass
+        # ロガーはファイルごとに分ける（別のパスの Metrics が同じプロセスにあっても混ざらない。同じパスならハンドラを共有）
+        self.logger = logging.getLogger(f"jifra.metrics.{os.path.abspath(path)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            try:
+                handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self.logger.addHandler(handler)
+            except OSError:
+                pass
+
+    def record(self, base, **fields):
+        rec = {"ts": round(time.time(), 3), **base, **fields}
+        for k, v in rec.items():
+            if isinstance(v, float):
+                rec[k] = round(v, 1)
+        with self.lock:
+            self.records.append(rec)
+        self.logger.info(json.dumps(rec, ensure_ascii=False))
+
+    def timing(self, name, ms):
+        with self.lock:
+            self.timings.setdefault(name, deque(maxlen=self.window)).append(ms)
+
+    def summary(self):
+        with self.lock:
+            records = list(self.records)
+            parse = sorted(self.timings.get("parse", ()))
+        requests = [r for r in records if r.get("event") == "request"]
+        # API を実際に呼んだもの（キャッシュ・合流を除く）
+        api = [r for r in requests if r.get("outcome") in ("ok", "error", "throttled")]
+
+        def stats(rows):
+            lat = sorted(r.get("latency_ms", 0) for r in rows)
+            return {
+                "requests": len(rows),
+                "p50_ms": percentile(lat, 0.5), "p95_ms": percentile(lat, 0.95), "p99_ms": percentile(lat, 0.99),
+                "errors": sum(1 for r in rows if r.get("outcome") in ("error", "throttled")),
+                "throttled_429": sum(r.get("throttled", 0) for r in rows),
+                "retries": sum(r.get("retries", 0) for r in rows),
+                "input_tokens": sum(r.get("input_tokens", 0) for r in rows),
+                "output_tokens": sum(r.get("output_tokens", 0) for r in rows),
+            }
+
+        groups = {}
+        for r in api:
+            groups.setdefault((r.get("style"), r.get("level"), r.get("lang"), r.get("model")), []).append(r)
+        return {
+            "total": len(requests),
+            "cache": sum(1 for r in requests if r.get("outcome") == "cache"),
+            "memory": sum(1 for r in requests if r.get("outcome") == "memory"),
+            "coalesced": sum(1 for r in requests if r.get("outcome") == "coalesced"),
+            "preflight": {a: sum(1 for r in records if r.get("event") == "preflight" and r.get("action") == a) for a in ("empty", "passthrough", "same")},
+            "api": stats(api),
+            "queue_p95_ms": percentile(sorted(r.get("queue_ms", 0) for r in api), 0.95),
+            "api_p95_ms": percentile(sorted(r.get("api_ms", 0) for r in api), 0.95),
+            "parse_p50_ms": percentile(parse, 0.5), "parse_p95_ms": percentile(parse, 0.95),
+            "by_mode": [{"style": k[0], "level": k[1], "lang": k[2], "model": k[3], **stats(v)} for k, v in sorted(groups.items(), key=lambda kv: -len(kv[1]))],
+            "recent_errors": [r for r in api if r.get("error")][-10:],
+        }
@@ -0,0 +1,385 @@
+"""
+Jifra 🗼 - モデルの選択・振り分けと API 呼び出し
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .metrics import percentile
+from .ratelimit import PRIORITY_FREE, estimate_tokens
+
+MODEL_PRIORITY = ["models/gemini-1.5-flash", "models/gemini-pro", "models/gemini-1.0-pro"]
+
+_genai = None
+_genai_lock = threading.Lock()
+
+def load_genai(api_key=None):
+    # google.generativeai の import は重いので、実際に必要になるまで遅延させる
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai = genai
+    return _genai
+
+class LazyModel:
+    # 初回の generate_content 時に GenerativeModel を生成する
+    # プロンプトテンプレートごとに system_instruction 付きのモデルを1回だけ作って使い回す
+    # バックグラウンドの再検証でモデルが変わった場合は switch() で差し替える
+    def __init__(self, name, api_key=None):
+        self.name = name
+        self.api_key = api_key
+        self.lock = threading.Lock()
+        self.models = {}  # template id (None = 素のモデル) -> GenerativeModel
+        self.inline = False  # system_instruction 非対応のモデルでは指示を入力に含める
+
+    def switch(self, name):
+        with self.lock:
+            if name != self.name:
+                self.name = name
+                self.models = {}
+                self.inline = False
+
+    def use_inline(self):
+        with self.lock:
+            self.inline = True
+            self.models = {}
+
+    def get(self, template=None):
+        with self.lock:
+            key = template.id if template else None
+            model = self.models.get(key)
+            if model is None:
+                genai = load_genai(self.api_key)
+                if template is None:
+                    model = genai.GenerativeModel(self.name)
+                elif self.inline:
+                    model = genai.GenerativeModel(self.name, generation_config=template.config)
+                else:
+                    model = genai.GenerativeModel(self.name, system_instruction=template.system, generation_config=template.config)
+                self.models[key] = model
+            return model, self.inline
+
+    def bind(self, template):
+        return ModeModel(self, template)
+
+    def generate_content(self, *args, **kwargs):
+        return self.get()[0].generate_content(*args, **kwargs)
+
+class ModeModel:
+    # テンプレートに紐づいたモデル: 送るのはユーザー入力部分だけ
+    def __init__(self, base, template):
+        self.base = base
+        self.template = template
+
+    def generate_content(self, contents, **kwargs):
+        model, inline = self.base.get(self.template)
+        if inline:
+            contents = f"{self.template.system}\n\n{contents}"
+        try:
+            return model.generate_content(contents, **kwargs)
+        except Exception as e:
+            # 旧モデル（gemini-1.0-pro 等）は system_instruction を受け付けない
+            if not inline and "instruction" in str(e).lower():
+                self.base.use_inline()
+                return self.generate_content(contents, **kwargs)
+            raise
+
+class ModelRouter:
+    # 複数の候補モデルを優先順に持ち、モデルごとの応答時間・エラー率を記録して振り分ける
+    # - 主モデルが観測 p95 を過ぎても応答しなければ、レート制限に空きがあれば次のモデルにも送り、先に返った方を使う
+    # - 429 を返したモデルは cooldown_sec の間後回しにし、次のモデルに切り替える
+    # name / bind / generate_content / switch を持つので LazyModel と同じように扱える（テストではスタブを渡せる）
+    MIN_SAMPLES = 20
+
+    def __init__(self, models, window, hedge_min_sec, hedge_default_sec, cooldown_sec, try_acquire=None, factory=None, workers=32):
+        self.models = list(models)
+        self.window = window
+        self.hedge_min_sec = hedge_min_sec
+        self.hedge_default_sec = hedge_default_sec
+        self.cooldown_sec = cooldown_sec
+        self.try_acquire = try_acquire  # contents -> bool（None なら常にヘッジする）
+        self.factory = factory or LazyModel
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jifra-router")
+        self.latency = {}  # (name, stream) -> deque[秒]（ストリーミングは最初のチャンクまで）
+        self.outcomes = {}  # name -> deque[bool]
+        self.cooling = {}  # name -> 再び主に使える時刻
+        self.stats = {}  # name -> {"calls", "errors", "throttled", "hedged", "wins"}
+        self.totals = {"hedges": 0, "failovers": 0}
+
+    @property
+    def name(self):
+        # キャッシュキーや計測に使う代表名（優先順の先頭）
+        return self.models[0].name
+
+    def switch(self, names):
+        # 再検証で候補が変わったら入れ替える（同じ名前のモデルはそのまま使い続ける）
+        with self.lock:
+            current = {m.name: m for m in self.models}
+            self.models = [current.get(n) or self.factory(n) for n in names]
+
+    def bind(self, template):
+        return RoutedModel(self, template)
+
+    def generate_content(self, contents, **kwargs):
+        return self.generate(None, contents, kwargs)
+
+    def _stat(self, name):
+        return self.stats.setdefault(name, {"calls": 0, "errors": 0, "throttled": 0, "hedged": 0, "wins": 0})
+
+    def _record(self, name, stream, seconds=None, error=None):
+        with self.lock:
+            s = self._stat(name)
+            s["calls"] += 1
+            self.outcomes.setdefault(name, deque(maxlen=self.window)).append(error is None)
+            if error is None:
+                self.latency.setdefault((name, stream), deque(maxlen=self.window)).append(seconds)
+                return
+            s["errors"] += 1
+            if "429" in str(error):
+                s["throttled"] += 1
+                self.cooling[name] = time.monotonic() + self.cooldown_sec
+
+    def _error_rate(self, name):
+        outcomes = self.outcomes.get(name)
+        if not outcomes or len(outcomes) < self.MIN_SAMPLES:
+            return 0.0
+        return 1 - sum(outcomes) / len(outcomes)
+
+    def order(self):
+        # 429 で休止中・エラーの多いモデルは後ろへ（全部そうなら優先順のまま）
+        now = time.monotonic()
+        with self.lock:
+            models = list(self.models)
+            healthy = [m for m in models if self.cooling.get(m.name, 0) <= now and self._error_rate(m.name) < 0.5]
+            return healthy + [m for m in models if m not in healthy]
+
+    def deadline(self, name, stream):
+        with self.lock:
+            samples = sorted(self.latency.get((name, stream), ()))
+        if len(samples) < self.MIN_SAMPLES:
+            return self.hedge_default_sec
+        return max(self.hedge_min_sec, percentile(samples, 0.95))
+
+    def _call(self, model, template, contents, kwargs, begun=None):
+        stream = kwargs.get("stream", False)
+        if begun is not None:
+            begun.set()
+        started = time.perf_counter()
+        try:
+            target = model.bind(template) if template is not None else model
+            response = target.generate_content(contents, **kwargs)
+            if stream:
+                # 最初のチャンクが届いた時点を「応答」とみなす
+                chunks = iter(response)
+                first = next(chunks, None)
+                response = itertools.chain([first], chunks) if first is not None else iter(())
+        except Exception as e:
+            self._record(model.name, stream, error=e)
+            raise
+        self._record(model.name, stream, time.perf_counter() - started)
+        return response
+
+    def generate(self, template, contents, kwargs):
+        order = self.order()
+        primary, backups = order[0], order[1:]
+        if not backups:
+            return self._call(primary, template, contents, kwargs)
+
+        begun = threading.Event()
+        pending = {self.pool.submit(self._call, primary, template, contents, kwargs, begun): primary}
+        # プールの空き待ちは期限に含めない（主モデルの呼び出しが始まってから数える）
+        begun.wait()
+        started = time.perf_counter()
+        deadline = self.deadline(primary.name, kwargs.get("stream", False))
+        hedged = False
+        error = None
+        while pending:
+            timeout = None if hedged or not backups else max(0.0, deadline - (time.perf_counter() - started))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 期限切れ: 空きがあれば次のモデルにも送る（遅い方の結果は捨てる）
+                hedged = True
+                if self.try_acquire is None or self.try_acquire(contents):
+                    model = backups.pop(0)
+                    pending[self.pool.submit(self._call, model, template, contents, kwargs)] = model
+                    with self.lock:
+                        self._stat(model.name)["hedged"] += 1
+                        self.totals["hedges"] += 1
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    # 429 は次のモデルへ切り替える（もう一方が実行中ならその結果を待つ。レート制限に空きがなければ諦める）
+                    if "429" in str(e) and backups and not pending and (self.try_acquire is None or self.try_acquire(contents)):
+                        failover = backups.pop(0)
+                        pending[self.pool.submit(self._call, failover, template, contents, kwargs)] = failover
+                        with self.lock:
+                            self.totals["failovers"] += 1
+                    continue
+                if model is not primary:
+                    with self.lock:
+                        self._stat(model.name)["wins"] += 1
+                return response
+        raise error
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            rows = []
+            for m in self.models:
+                lat = sorted(itertools.chain(self.latency.get((m.name, False), ()), self.latency.get((m.name, True), ())))
+                rows.append({
+                    "model": m.name, **self._stat(m.name),
+                    "p50_ms": percentile(lat, 0.5) * 1000, "p95_ms": percentile(lat, 0.95) * 1000,
+                    "error_rate": self._error_rate(m.name), "cooling": self.cooling.get(m.name, 0) > now,
+                })
+            return {"models": rows, **self.totals}
+
+class RoutedModel:
+    # テンプレートに紐づけたルーター（ModeModel と同じ使い方）
+    def __init__(self, router, template):
+        self.router = router
+        self.template = template
+
+    def generate_content(self, contents, **kwargs):
+        return self.router.generate(self.template, contents, kwargs)
+
+def load_model_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        return state if state.get("model") else None
+    except (OSError, ValueError):
+        return None
+
+def discover_model(api_key, path):
+    genai = load_genai(api_key)
+    available = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+    target = next((p for p in MODEL_PRIORITY if p in available), available[0] if available else MODEL_PRIORITY[0])
+    state = {"model": target, "available": available, "updated": time.time()}
+    # 書き込み途中のファイルを読まないよう、一時ファイルから置き換える
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return state
+
+def candidate_models(state, count):
+    # 利用可能なモデルを優先順に並べ、先頭から count 個を候補にする
+    available = state.get("available") if state else None
+    names = [p for p in MODEL_PRIORITY if not available or p in available]
+    if state and state["model"] not in names:
+        names.insert(0, state["model"])
+    return names[:max(1, count)]
+
+def revalidate_model(model, api_key, path, count):
+    try:
+        model.switch(candidate_models(discover_model(api_key, path), count))
+    except Exception:
+        # 一覧取得に失敗しても現在のモデルで動作を続ける
+        pass
+
+def usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", 0) or 0
+
+def record_usage(stats, response):
+    usage = getattr(response, "usage_metadata", None)
+    stats["input_tokens"] = getattr(usage, "prompt_token_count", 0) or 0
+    stats["output_tokens"] = getattr(usage, "candidates_token_count", 0) or 0
+
+def truncated(response):
+    # max_output_tokens で打ち切られた応答（途中までの訳を成功として返さない）
+    candidates = getattr(response, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return getattr(reason, "name", reason) in ("MAX_TOKENS", 2)
+
+TRUNCATED = "Output truncated at max_output_tokens"
+
+def new_call_stats(stats):
+    # 呼び出し側から渡された dict に計測値を書き込む（計測不要なら None）
+    stats = {} if stats is None else stats
+    stats.update(retries=0, throttled=0, queue_ms=0.0, api_ms=0.0, input_tokens=0, output_tokens=0)
+    return stats
+
+def call_api(model, prompt, limiter, priority=PRIORITY_FREE, generation_config=None, stats=None):
+    stats = new_call_stats(stats)
+    estimated = estimate_tokens(prompt)
+    max_retries = 3
+    for i in range(max_retries):
+        stats["queue_ms"] += limiter.acquire(estimated, priority) * 1000
+        started = time.perf_counter()
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config)
+            stats["api_ms"] += (time.perf_counter() - started) * 1000
+            record_usage(stats, response)
+            limiter.settle(estimated, usage_tokens(response))
+            if truncated(response):
+                return None, TRUNCATED
+            return response.text, None
+        except Exception as e:
+            stats["api_ms"] += (time.perf_counter() - started) * 1000
+            if "429" in str(e):
+                stats["throttled"] += 1
+                if i < max_retries - 1:
+                    stats["retries"] += 1
+                    limiter.penalize((2 ** i) + random.random())
+                    continue
+            return None, str(e)
+    return None, "Error"
+
+def call_api_stream(model, prompt, on_chunk, limiter, priority=PRIORITY_FREE, generation_config=None, stats=None):
+    # ストリーミング版: 受信したチャンクを逐次 on_chunk に渡す
+    # 429のリトライは、まだ何も受信していない場合のみ行う
+    stats = new_call_stats(stats)
+    estimated = estimate_tokens(prompt)
+    max_retries = 3
+    for i in range(max_retries):
+        stats["queue_ms"] += limiter.acquire(estimated, priority) * 1000
+        started = time.perf_counter()
+        received = []
+        try:
+            for chunk in model.generate_content(prompt, stream=True, generation_config=generation_config):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # テキストを含まないチャンク（終了通知など）
+                    continue
+                if text:
+                    if not received:
+                        stats["first_chunk_ms"] = (time.perf_counter() - started) * 1000
+                    received.append(text)
+                    on_chunk(text)
+            stats["api_ms"] += (time.perf_counter() - started) * 1000
+            if not received:
+                return None, "Empty response"
+            record_usage(stats, chunk)
+            limiter.settle(estimated, usage_tokens(chunk))
+            if truncated(chunk):
+                return None, TRUNCATED
+            return "".join(received), None
+        except Exception as e:
+            stats["api_ms"] += (time.perf_counter() - started) * 1000
+            if "429" in str(e):
+                stats["throttled"] += 1
+                if not received and i < max_retries - 1:
+                    stats["retries"] += 1
+                    limiter.penalize((2 ** i) + random.random())
+                    continue
+            return None, str(e)
+    return None, "Error"
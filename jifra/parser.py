@@ -0,0 +1,168 @@
+"""
+Jifra 🗼 - 生成結果のパーサー（text / back / label ブロックへの分解）
+"""
+
+import json
+
+from .prompts import VARIATION_SEPARATOR, is_multi_lang
+
+LANG_LABELS = {"ja": "JP", "fr": "FR", "en": "EN"}
+
+class BlockParser:
+    # 生成結果を行単位で text/back/label ブロックに分解する
+    # ストリーミング中はチャンクを feed し、確定したブロックだけを受け取る
+    # separated=True は逆翻訳なしの結果用（VARIATION_SEPARATOR の行で案を区切り、間の行は空行も含めてそのまま1案にする）
+    def __init__(self, separated=False):
+        self.separated = separated
+        self.buffer = ""
+        self.blocks = []
+        self.current_block = {"text": "", "back": "", "label": ""}
+
+    def feed(self, chunk):
+        start = len(self.blocks)
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split('\n')
+        for line in lines:
+            self._line(line)
+        return self.blocks[start:]
+
+    def close(self):
+        start = len(self.blocks)
+        if self.buffer:
+            self._line(self.buffer)
+            self.buffer = ""
+        self._flush()
+        return self.blocks[start:]
+
+    def _flush(self):
+        text = self.current_block["text"].strip()
+        if text:
+            self.blocks.append({**self.current_block, "text": text})
+        self.current_block = {"text": "", "back": "", "label": ""}
+
+    def _line(self, line):
+        line = line.strip()
+        if self.separated:
+            if line == VARIATION_SEPARATOR:
+                self._flush()
+            elif line or self.current_block["text"]:
+                self.current_block["text"] += f"\n{line}" if self.current_block["text"] else line
+            return
+        if not line:
+            return
+        
+        # SNSラベル
+        if line.startswith('[JP]') or line.startswith('[EN]') or line.startswith('[FR]'):
+            if self.current_block["text"]:
+                self.blocks.append(self.current_block)
+                self.current_block = {"text": "", "back": "", "label": ""}
+            label = line[:4]
+            self.current_block["label"] = {"[JP]": "JP", "[EN]": "EN", "[FR]": "FR"}.get(label, label)
+            self.current_block["text"] = line[4:].strip()
+            return
+        
+        # 戻し訳（括弧で始まり括弧で終わる）
+        if line.startswith('(') and line.endswith(')'):
+            self.current_block["back"] = line
+            if self.current_block["text"]:
+                self.blocks.append(self.current_block)
+                self.current_block = {"text": "", "back": "", "label": ""}
+        # ラベル行をスキップ
+        elif line.startswith('[') and line.endswith(']'):
+            if self.current_block["text"]:
+                self.blocks.append(self.current_block)
+            self.current_block = {"text": "", "back": "", "label": ""}
+        else:
+            # 通常テキスト
+            if self.current_block["text"]:
+                # 同じブロックに追加しない、新しいブロックとして追加
+                if self.current_block["back"]:
+                    # 既に戻し訳がある場合は新しいブロック
+                    self.blocks.append(self.current_block)
+                    self.current_block = {"text": line, "back": "", "label": ""}
+                else:
+                    # まだ戻し訳がない場合は改行で追加
+                    self.current_block["text"] += "\n" + line
+            else:
+                self.current_block["text"] = line
+
+def parse_blocks(raw, separated=False):
+    parser = BlockParser(separated)
+    parser.feed(raw)
+    parser.close()
+    return parser.blocks
+
+def parse_json_blocks(raw, lang):
+    # All targets の JSON 出力を言語ごとのブロックに変換（各言語の先頭にラベル）
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    data = json.loads(text)
+    blocks = []
+    for key in lang.split("+"):
+        items = data.get(key) or []
+        if isinstance(items, (str, dict)):
+            items = [items]
+        for i, item in enumerate(items):
+            if isinstance(item, str):
+                item = {"text": item}
+            back = (item.get("back") or "").strip()
+            if back and not back.startswith("("):
+                back = f"({back})"
+            blocks.append({"text": (item.get("text") or "").strip(), "back": back, "label": LANG_LABELS[key] if i == 0 else ""})
+    return [b for b in blocks if b["text"]]
+
+def parse_result(raw, lang=None, back=True):
+    # back=False は逆翻訳なしのテンプレートで生成した結果
+    if is_multi_lang(lang):
+        try:
+            return parse_json_blocks(raw, lang)
+        except (ValueError, AttributeError):
+            # JSONとして読めない場合は通常の行パーサーで表示
+            pass
+    return parse_blocks(raw, separated=not back)
+
+def parse_back(raw, count):
+    # 後から取得した逆翻訳（JSON 配列）を、元の案と同じ数の "(...)" にする
+    # 配列として読めない・数が合わない場合は None（どの案の訳か分からないものは表示しない）
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    backs = []
+    for item in items:
+        item = str(item).strip()
+        backs.append(item if not item or item.startswith("(") else f"({item})")
+    return backs
+
+def assemble_chunks(raws, lang, back=True):
+    # 各チャンクの n 番目の案どうしを順に連結し、文書全体の訳を作る（逆翻訳はチャンクごとに表示）
+    parsed = [parse_result(raw, lang, back) for raw in raws]
+    blocks = []
+    for n in range(min(len(p) for p in parsed) if parsed else 0):
+        blocks.append({"text": "\n\n".join(p[n]["text"] for p in parsed), "back": "", "label": parsed[0][n]["label"]})
+    return blocks
+
+def extract_history_texts(result):
+    lines = result.strip().split('\n')
+    extracted_texts = []
+    
+    # テキスト抽出（ラベルや戻し訳を除外）
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('(') and not line.startswith('[') and not line.endswith(':') and len(line) > 2:
+            extracted_texts.append(line)
+    
+    # 重複を除去（生成順は維持）
+    seen = set()
+    unique_texts = []
+    for t in extracted_texts:
+        if t not in seen:
+            unique_texts.append(t)
+            seen.add(t)
+    return unique_texts
@@ -0,0 +1,68 @@
+"""
+Jifra 🗼 - プリフライト（API を呼ぶ前に、入力の文字種・言語をローカルで判定する）
+"""
+
+import re
+from collections import namedtuple
+
+# action: None（そのまま生成）/ "empty"（中身がない）/ "passthrough"（絵文字・URL・数字だけ。入力をそのまま返す）
+#         / "same"（翻訳先と同じ言語。suggest に別の翻訳先を提案）
+Preflight = namedtuple("Preflight", "action lang suggest")
+
+PROCEED = Preflight(None, None, None)
+
+INVISIBLE = re.compile(r"[\s\u200b-\u200f\u2060\ufeff]+")
+LINKS = re.compile(r"https?://\S+|www\.\S+|[\w.+-]+@[\w-]+\.[\w.]+")
+LETTER = re.compile(r"[^\W\d_]")
+KANA = re.compile(r"[\u3040-\u30ff\u31f0-\u31ff\uff66-\uff9f]")
+HAN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+LATIN = re.compile(r"[A-Za-z\u00c0-\u024f]")
+WORD = re.compile(r"[a-z\u00e0-\u00ff\u0153']+")
+FRENCH_MARKS = re.compile(r"[àâæçéèêëîïôœùûüÿ]")
+
+# 短い入力でも決め手になりやすい機能語（内容語は両言語で重なるので使わない）
+FRENCH_WORDS = frozenset("le la les un une des du de et est sont je tu il elle nous vous ils elles pas ne que qui pour dans avec sur au aux ce cette mais ou où très merci bonjour oui non c'est j'ai".split())
+ENGLISH_WORDS = frozenset("the an and is are was were i you he she we they not to of in for with at this that it's i'm but or very thanks thank hello yes no do does have has will".split())
+
+# 言語の判定は先頭だけで足りる（長文でも判定時間を一定にする）
+SAMPLE_CHARS = 256
+
+# 同じ言語を選んだ時に提案する翻訳先（FREE でも選べる ja / fr）
+SUGGEST = {"ja": "fr", "fr": "ja", "en": "ja"}
+
+def detect_language(text):
+    # 文字種で判定: かながあれば日本語、漢字だけなら短いものに限り日本語（長いものは中国語の可能性）
+    # ラテン文字は機能語とアクセント記号を数え、2つ以上の差がなければ判定しない
+    latin = len(LATIN.findall(text))
+    if KANA.search(text):
+        # 漢字・かなは1文字あたりの情報量が多いので、ラテン文字3文字分と数える
+        return "ja" if (len(KANA.findall(text)) + len(HAN.findall(text))) * 3 >= latin else None
+    if HAN.search(text):
+        return "ja" if latin == 0 and len(HAN.findall(text)) <= 8 else None
+    if latin < 2:
+        return None
+    lower = text.lower()
+    words = WORD.findall(lower)
+    fr = sum(1 for w in words if w in FRENCH_WORDS) + len(FRENCH_MARKS.findall(lower))
+    en = sum(1 for w in words if w in ENGLISH_WORDS)
+    if fr >= 2 and fr > en:
+        return "fr"
+    if en >= 2 and en > fr:
+        return "en"
+    return None
+
+def preflight(text, style, lang):
+    # 翻訳モード（casual / formal）の単一言語の翻訳先だけを判定する（SNS・プロンプトは絵文字だけでも生成する意味がある）
+    if not INVISIBLE.sub("", text):
+        return Preflight("empty", None, None)
+    if style not in ("casual", "formal"):
+        return PROCEED
+    # URL・メールは含まれている時だけ取り除く（正規表現を毎回走らせない）
+    if not LETTER.search(LINKS.sub("", text) if "@" in text or "://" in text or "www." in text else text):
+        return Preflight("passthrough", None, None)
+    if not lang or "+" in lang:
+        return PROCEED
+    detected = detect_language(text[:SAMPLE_CHARS])
+    if detected == lang:
+        return Preflight("same", detected, SUGGEST[detected])
+    return Preflight(None, detected, None)
@@ -0,0 +1,113 @@
+"""
+Jifra 🗼 - プロンプトテンプレート（モードごとの固定指示と生成設定）
+"""
+
+import functools
+from collections import namedtuple
+
+QUIET = "OUTPUT ONLY THE RESULT. NO INTRO. NO CHAT. NO EXPLANATION."
+STRICT = f"{QUIET} SEPARATE EACH OUTPUT WITH A BLANK LINE."
+
+# 逆翻訳なしの結果で案どうしを区切る行（訳文の中の空行と区別するため、空行では区切らない）
+VARIATION_SEPARATOR = "---"
+
+LANG_NAMES = {"ja": "Japanese", "fr": "French", "en": "English"}
+
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+# モードごとの固定指示は system_instruction としてモデル側に持たせ、毎回送るのはユーザー入力だけにする
+# 指示や設定を変えたら version を上げる（キャッシュキーに含まれる）
+# copies は出力に入力の何倍の分量が入るか（案・逆翻訳・言語の数）。max_output_tokens はこれと入力の長さで広げる
+PromptTemplate = namedtuple("PromptTemplate", "id version system user config copies", defaults=(1,))
+
+PROMPT_TEMPLATES = {
+    # ★ Literal: 画像生成視点の忠実な翻訳
+    ("prompt", 1): PromptTemplate("prompt-1", 2, f"""{STRICT}
+Convert the user's text to a simple English image generation prompt.
+Keep the original meaning but phrase it for visual AI (describe what to see, not actions).
+Output the English prompt first, then the Japanese back-translation in parentheses on a NEW LINE.""", "{input}", {"max_output_tokens": 300}, 2),
+    # ★★ Creative: 豊かな表現（短め）
+    ("prompt", 2): PromptTemplate("prompt-2", 2, f"""{STRICT}
+Create a concise image prompt with atmosphere and mood from the user's text. Keep it under 30 words.
+Output English first, then Japanese translation in parentheses on a NEW LINE.""", "{input}", {"max_output_tokens": 300}, 2),
+    # ★★★ Masterpiece: プロ仕様タグ
+    ("prompt", 3): PromptTemplate("prompt-3", 2, f"""{STRICT}
+Create a professional-level image generation prompt from the user's text with:
+- Camera settings (lens, aperture, etc.)
+- Lighting (natural, studio, golden hour, etc.)
+- Art style (photorealistic, anime, oil painting, etc.)
+Use comma-separated format.
+Output the English prompt first, then the Japanese back-translation in parentheses on a NEW LINE.""", "{input}", {"max_output_tokens": 600}, 2),
+    ("sns", None): PromptTemplate("sns", 2, f"""{STRICT}
+Translate the user's input to JP/EN/FR for SNS. No imaginary content. Add emoji and hashtags.
+Use [JP] [EN] [FR] as labels.
+
+[JP] [text]
+#tags
+
+[EN] [text]
+#tags
+
+[FR] [text]
+#tags""", "Input: {input}", {"max_output_tokens": 1000}, 4),
+    # 逆翻訳だけを後から取得する（結果の各案を JSON 配列でまとめて1回で送る）
+    ("back", None): PromptTemplate("back", 2, """Translate each string in the user's JSON array into natural Japanese.
+Respond with a JSON array of strings only: the same number of items, in the same order.""", "{input}", {**JSON_CONFIG, "max_output_tokens": 4000}, 2),
+}
+
+def resolve_back(style, back):
+    # 逆翻訳なしの版があるのは翻訳・プロンプトだけ（SNS はいつもの形式で生成・表示する）
+    return back or style not in ("casual", "formal", "prompt")
+
+def is_multi_lang(lang):
+    # "ja+fr+en" のような複数言語指定（All targets）
+    return bool(lang) and "+" in lang
+
+@functools.lru_cache(maxsize=None)
+def get_template(style, level, lang, back=True):
+    # back=False は逆翻訳なしの版（案だけを VARIATION_SEPARATOR の行で区切って返す。逆翻訳は開いた時に "back" で取得）
+    if style == "prompt":
+        template = PROMPT_TEMPLATES[("prompt", level if level in (1, 2) else 3)]
+        if back:
+            return template
+        # 最後の行が逆翻訳の指示
+        system = template.system.rsplit("\n", 1)[0] + "\nOutput only the English prompt."
+        return template._replace(id=f"{template.id}-nb", system=system, config={"max_output_tokens": template.config["max_output_tokens"] // 2}, copies=1)
+    if style in ("sns", "back"):
+        return PROMPT_TEMPLATES[(style, None)]
+
+    tone = "casual friendly" if style == 'casual' else "formal polite"
+    if is_multi_lang(lang):
+        # 全言語を1回の呼び出しで取得（JSON出力）
+        keys = lang.split("+")
+        names = ", ".join(f'"{k}" ({LANG_NAMES[k]})' for k in keys)
+        if not back:
+            schema = ", ".join(f'"{k}": [{{"text": "..."}}, {{"text": "..."}}]' for k in keys)
+            return PromptTemplate(f"{style}-{lang}-nb", 2, f"""Translate the user's input into each of these languages in {tone} tone: {names}.
+Give 2 variations per language. Do not add back-translations.
+Respond with JSON only, using exactly these keys:
+{{{schema}}}""", "Input: {input}", {**JSON_CONFIG, "max_output_tokens": 300 * len(keys)}, 2 * len(keys))
+        schema = ", ".join(f'"{k}": [{{"text": "...", "back": "..."}}, {{"text": "...", "back": "..."}}]' for k in keys)
+        return PromptTemplate(f"{style}-{lang}", 2, f"""Translate the user's input into each of these languages in {tone} tone: {names}.
+Give 2 variations per language. For each variation, add the Japanese back-translation.
+Respond with JSON only, using exactly these keys:
+{{{schema}}}""", "Input: {input}", {**JSON_CONFIG, "max_output_tokens": 600 * len(keys)}, 4 * len(keys))
+
+    if not back:
+        return PromptTemplate(f"{style}-{lang}-nb", 3, f"""{QUIET}
+Translate the user's input to {LANG_NAMES[lang]} in {tone} tone. Keep the paragraph breaks of the input.
+Give 2 variations. Put a line containing only {VARIATION_SEPARATOR} between the two variations.
+Do not add back-translations.""", "Input: {input}", {"max_output_tokens": 300}, 2)
+
+    return PromptTemplate(f"{style}-{lang}", 2, f"""{STRICT}
+Translate the user's input to {LANG_NAMES[lang]} in {tone} tone.
+Give 2 variations. Each variation should be on its own line.
+After each variation, add the Japanese back-translation in parentheses on a NEW LINE.
+Do NOT combine them on the same line.""", "Input: {input}", {"max_output_tokens": 600}, 4)
+
+def build_prompt(template, input_text):
+    return template.user.format(input=input_text)
+
+def output_limit(template, input_text, ceiling):
+    # 固定の max_output_tokens は短い入力向けの最低値。入力1文字あたり、出力の各コピーに1.5トークンまで見込む
+    return min(ceiling, template.config["max_output_tokens"] + template.copies * len(input_text) * 3 // 2)
@@ -0,0 +1,119 @@
+"""
+Jifra 🗼 - レート制限（RPM/TPM のトークンバケット + 優先度付き待ち行列）
+"""
+
+import threading
+import time
+from collections import deque
+
+PRIORITY_PRO, PRIORITY_FREE, PRIORITY_BATCH = 0, 1, 2
+
+class RateLimiter:
+    # RPM/TPM のトークンバケット + 優先度付き待ち行列
+    # 優先度の小さい順（同じなら到着順）に払い出し、長く待った呼び出しは優先度を繰り上げる
+    def __init__(self, rpm, tpm, aging_sec):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.aging_sec = aging_sec
+        self.cond = threading.Condition()
+        self.req_tokens = float(rpm)
+        self.tok_tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.queue = []  # [(priority, seq, enqueued)]
+        self.head = None  # 最後に確認した先頭（時間の経過による繰り上げで替わったことに気付くため）
+        self.seq = 0
+        self.waits = deque(maxlen=1000)
+        self.stats = {"admitted": 0, "throttled": 0, "max_depth": 0}
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.req_tokens = min(self.rpm, self.req_tokens + elapsed * self.rpm / 60)
+        self.tok_tokens = min(self.tpm, self.tok_tokens + elapsed * self.tpm / 60)
+
+    def _head(self, now):
+        return min(self.queue, key=lambda t: (t[0] - int((now - t[2]) / self.aging_sec), t[1]))
+
+    def _next_aging(self, now):
+        # 待ち行列のどれかの優先度が次に繰り上がるまでの秒数（先頭が替わりうる最も早い時刻）
+        return min(self.aging_sec - (now - t[2]) % self.aging_sec for t in self.queue) + 0.001
+
+    def acquire(self, tokens, priority=PRIORITY_FREE):
+        start = time.monotonic()
+        with self.cond:
+            self.seq += 1
+            ticket = (priority, self.seq, start)
+            self.queue.append(ticket)
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self.queue))
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    head = self._head(now)
+                    if head is not self.head:
+                        # 繰り上げで先頭が替わった: 新しい先頭が眠ったままにならないよう全員を起こす
+                        self.head = head
+                        self.cond.notify_all()
+                    # 先頭でなくても次の繰り上げの時点で起きて確かめる
+                    delay = self._next_aging(now)
+                    if head is ticket:
+                        # 1回でTPM上限を超える依頼も、満タンになれば通す
+                        need_req = 1 - self.req_tokens
+                        need_tok = min(tokens, self.tpm) - self.tok_tokens
+                        if need_req <= 0 and need_tok <= 0 and now >= self.paused_until:
+                            self.req_tokens -= 1
+                            self.tok_tokens -= tokens
+                            break
+                        delay = min(delay, max(need_req * 60 / self.rpm, need_tok * 60 / self.tpm, self.paused_until - now, 0.01))
+                    self.cond.wait(delay)
+            finally:
+                self.queue.remove(ticket)
+                if self.head is ticket:
+                    self.head = None
+                self.cond.notify_all()
+            waited = time.monotonic() - start
+            self.waits.append(waited)
+            self.stats["admitted"] += 1
+        return waited
+
+    def settle(self, estimated, actual):
+        # 実際の消費トークン数で見積もりとの差を精算
+        if actual:
+            with self.cond:
+                self.tok_tokens -= actual - estimated
+                self.cond.notify_all()
+
+    def penalize(self, seconds):
+        # 429を受けたら全呼び出しをまとめて一時停止（呼び出しごとに個別にリトライしない）
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.stats["throttled"] += 1
+            self.cond.notify_all()
+
+    def try_acquire(self, tokens):
+        # 待ちがなく枠が余っている場合だけ払い出す（ヘッジのような追加の呼び出し用、待たない）
+        with self.cond:
+            now = time.monotonic()
+            self._refill(now)
+            if self.queue or now < self.paused_until or self.req_tokens < 1 or self.tok_tokens < min(tokens, self.tpm):
+                return False
+            self.req_tokens -= 1
+            self.tok_tokens -= tokens
+            self.stats["admitted"] += 1
+            return True
+
+    def snapshot(self):
+        with self.cond:
+            s = dict(self.stats)
+            s["depth"] = len(self.queue)
+            s["depth_pro"] = sum(1 for t in self.queue if t[0] == PRIORITY_PRO)
+            waits = sorted(self.waits)
+        s["wait_avg"] = sum(waits) / len(waits) if waits else 0.0
+        s["wait_p95"] = waits[int(len(waits) * 0.95)] if waits else 0.0
+        s["wait_max"] = waits[-1] if waits else 0.0
+        return s
+
+def estimate_tokens(prompt):
+    # 入力（日本語は1文字≒1トークン）+ 出力の概算
+    return len(prompt) // 2 + 256
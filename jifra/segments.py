@@ -0,0 +1,55 @@
+"""
+Jifra 🗼 - 入力の分割（バッチのファイル読み込み・長文のチャンク分割）と CSV 出力
+"""
+
+import csv
+import io
+import re
+
+def read_segments(name, data):
+    text = data.decode("utf-8-sig", errors="replace")
+    if not name.lower().endswith(".csv"):
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+    rows = [r for r in csv.reader(io.StringIO(text)) if r]
+    if not rows:
+        return []
+    # ヘッダーに "text" 列があればそれを使い、なければ1列目
+    header = [c.strip().lower() for c in rows[0]]
+    col = 0
+    if "text" in header:
+        col = header.index("text")
+        rows = rows[1:]
+    return [r[col].strip() for r in rows if len(r) > col and r[col].strip()]
+
+# 文末（。！？ の後、閉じ括弧があればその後。英文は . ! ? の後の空白の手前）
+SENTENCE_BREAK = re.compile(r"(?<=[。！？])(?![」』）)。！？])|(?<=[。！？][」』）)])|(?<=[.!?])(?=\s)")
+
+def split_chunks(text, limit):
+    # 段落 → 文 → 文字数の順に区切り、limit 文字以下の塊に詰め直す
+    units = []
+    for para in re.split(r"\n\s*\n", text.strip()):
+        if len(para) <= limit:
+            pieces = [para]
+        else:
+            pieces = [s[i:i + limit] for s in SENTENCE_BREAK.split(para) for i in range(0, len(s), limit)]
+        units.append(("\n\n", pieces[0]))
+        units.extend(("", p) for p in pieces[1:])
+
+    chunks, current = [], ""
+    for sep, unit in units:
+        if current and len(current) + len(sep) + len(unit) > limit:
+            chunks.append(current.strip())
+            current = unit
+        else:
+            current = current + sep + unit if current else unit
+    chunks.append(current.strip())
+    return [c for c in chunks if c]
+
+def batch_to_csv(results):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=["no", "input", "output", "error"])
+    writer.writeheader()
+    writer.writerows(results)
+    # Excelで文字化けしないようBOM付き
+    return ("\ufeff" + buf.getvalue()).encode("utf-8")
@@ -0,0 +1,126 @@
+"""
+Jifra 🗼 - ローカル HTTP API（ThreadingHTTPServer、1リクエスト1スレッド）
+
+    POST /translate  {"text": "...", "style": "casual", "lang": "fr", "level": 1}
+    POST /batch      {"texts": ["...", ...], "style": "formal", "lang": "en"}
+    POST /back       {"texts": ["...", ...]}  "back": false で生成した案の逆翻訳をまとめて取得
+    GET  /metrics    計測値の集計
+    GET  /health
+"""
+
+import hmac
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .prompts import LANG_NAMES
+from .ratelimit import PRIORITY_BATCH, PRIORITY_FREE
+
+STYLES = ("casual", "formal", "sns", "prompt")
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH = 500
+
+def parse_request(body):
+    # 入力の検証。おかしな値は ValueError（400 で返す）
+    style = body.get("style", "casual")
+    if style not in STYLES:
+        raise ValueError(f"style must be one of {', '.join(STYLES)}")
+    lang = body.get("lang", "fr") if style in ("casual", "formal") else None
+    if lang == "all":
+        lang = "+".join(LANG_NAMES)
+    if lang is not None and (not isinstance(lang, str) or not all(k in LANG_NAMES for k in lang.split("+"))):
+        raise ValueError(f"lang must be 'all' or a '+'-joined list of {', '.join(LANG_NAMES)}")
+    level = body.get("level", 1)
+    if level not in (1, 2, 3):
+        raise ValueError("level must be 1, 2 or 3")
+    back = body.get("back", True)
+    if not isinstance(back, bool):
+        raise ValueError("back must be true or false")
+    return style, level, lang, back
+
+class Handler(BaseHTTPRequestHandler):
+    engine = None  # serve() が設定する
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # アクセスログは計測ログ（engine.metrics）に任せる
+        pass
+
+    def send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def authorized(self):
+        token = self.engine.config.api_token
+        if not token:
+            return True
+        given = self.headers.get("Authorization", "")
+        return hmac.compare_digest(given.encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self.send_json(200, {"ok": True})
+        if not self.authorized():
+            return self.send_json(401, {"error": "unauthorized"})
+        if self.path == "/metrics":
+            return self.send_json(200, {**self.engine.metrics.summary(), "router": self.engine.model.snapshot()})
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.authorized():
+            return self.send_json(401, {"error": "unauthorized"})
+        # 本文の長さは Content-Length だけで判断する（chunked は受け付けない。負の値で read が止まらないように）
+        # 不正な値はすべて 400（例外を handler の外に出さない）
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self.send_json(411, {"error": "Content-Length required"})
+        try:
+            # int() は "-5"・"+5" や ASCII 以外の数字も受け付け、isdigit() は "²" を通すので、ASCII の数字だけに限る
+            if not (length.isascii() and length.strip().isdigit()):
+                raise ValueError
+            length = int(length)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            return self.send_json(400, {"error": "invalid Content-Length"})
+        if length > MAX_BODY_BYTES:
+            return self.send_json(413, {"error": "request body too large"})
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+            style, level, lang, back = parse_request(body)
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+
+        if self.path == "/translate":
+            text = body.get("text")
+            if not isinstance(text, str) or not text.strip():
+                return self.send_json(400, {"error": "text is required"})
+            result = self.engine.translate_document(style, level, lang, text, PRIORITY_FREE, back)
+            return self.send_json(502 if result["error"] else 200, result)
+
+        if self.path in ("/batch", "/back"):
+            texts = body.get("texts")
+            if not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t.strip() for t in texts):
+                return self.send_json(400, {"error": "texts must be a non-empty list of strings"})
+            if len(texts) > MAX_BATCH:
+                return self.send_json(400, {"error": f"at most {MAX_BATCH} texts per request"})
+            if self.path == "/back":
+                backs, err = self.engine.back_translate(texts, PRIORITY_FREE)
+                return self.send_json(502 if err else 200, {"error": err} if err else {"backs": backs})
+            rows = self.engine.run_batch(style, level, lang, texts, priority=PRIORITY_BATCH, back=back)
+            return self.send_json(200, {"results": rows})
+
+        self.send_json(404, {"error": "not found"})
+
+def serve(engine, host=None, port=None):
+    host = host or engine.config.http_host
+    port = engine.config.http_port if port is None else port
+    handler = type("EngineHandler", (Handler,), {"engine": engine})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,32 @@
+"""
+Jifra 🗼 - Metrics のテスト（ログの書き先と、描画の計測がリクエストの集計を押し出さないこと）
+
+    python -m pytest tests
+"""
+
+import json
+
+from jifra.metrics import Metrics
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["n"] for line in f]
+
+def test_each_path_gets_its_own_log(tmp_path):
+    a = Metrics(str(tmp_path / "a.jsonl"), 10**6, 1, 10)
+    b = Metrics(str(tmp_path / "b.jsonl"), 10**6, 1, 10)
+    a.record({"event": "request"}, n=1)
+    b.record({"event": "request"}, n=2)
+    assert read(tmp_path / "a.jsonl") == [1]
+    assert read(tmp_path / "b.jsonl") == [2]
+
+def test_render_timings_do_not_evict_requests(tmp_path):
+    metrics = Metrics(str(tmp_path / "m.jsonl"), 10**6, 1, 5)
+    for _ in range(3):
+        metrics.record({"event": "request"}, outcome="ok", latency_ms=100.0, n=0)
+    for _ in range(50):
+        metrics.timing("parse", 1.5)
+    summary = metrics.summary()
+    assert summary["total"] == 3
+    assert summary["parse_p50_ms"] == 1.5
+    assert len(read(tmp_path / "m.jsonl")) == 3
@@ -0,0 +1,44 @@
+"""
+Jifra 🗼 - パーサーのテスト（逆翻訳なしの結果の区切りと、分割翻訳の連結）
+
+    python -m pytest tests
+"""
+
+from jifra.parser import BlockParser, assemble_chunks, parse_back, parse_result
+from jifra.prompts import resolve_back
+
+def test_separated_variations_keep_blank_lines():
+    blocks = parse_result("A1\n\nB1\n---\nA2\n\nB2", "fr", back=False)
+    assert [b["text"] for b in blocks] == ["A1\n\nB1", "A2\n\nB2"]
+
+def test_chunks_pair_the_same_variation():
+    raws = ["Para A v1.\n\nPara B v1.\n---\nPara A v2.\n\nPara B v2.", "Para C v1.\n---\nPara C v2."]
+    assert [b["text"] for b in assemble_chunks(raws, "fr", back=False)] == [
+        "Para A v1.\n\nPara B v1.\n\nPara C v1.", "Para A v2.\n\nPara B v2.\n\nPara C v2."]
+
+def test_streaming_matches_whole_parse():
+    raw = "Salut !\n\nÇa va ?\n---\nCoucou\n"
+    parser = BlockParser(separated=True)
+    blocks = []
+    for i in range(0, len(raw), 5):
+        blocks += parser.feed(raw[i:i + 5])
+    blocks += parser.close()
+    assert blocks == parse_result(raw, "fr", back=False)
+
+def test_back_translated_layout_unchanged():
+    raw = "Salut, ça va ?\n(やあ、元気？)\n\nCoucou, tu vas bien ?\n(やっほー、元気にしてる？)"
+    assert [(b["text"], b["back"]) for b in parse_result(raw, "fr")] == [
+        ("Salut, ça va ?", "(やあ、元気？)"), ("Coucou, tu vas bien ?", "(やっほー、元気にしてる？)")]
+
+def test_sns_ignores_back_toggle():
+    raw = "[JP] 今日もいい天気\n#晴れ\n\n[EN] Lovely weather\n#sunny"
+    assert resolve_back("sns", False)
+    assert parse_result(raw, None, resolve_back("sns", False)) == parse_result(raw, None)
+    assert [b["label"] for b in parse_result(raw, None)] == ["JP", "EN"]
+
+def test_back_translations_must_match_the_variations():
+    assert parse_back('["やあ", "(元気？)"]', 2) == ["(やあ)", "(元気？)"]
+    assert parse_back('```json\n["やあ"]\n```', 1) == ["(やあ)"]
+    # 打ち切られた JSON や数の合わない配列は表示しない
+    assert parse_back('["やあ", "元', 2) is None
+    assert parse_back('["やあ"]', 2) is None
@@ -0,0 +1,57 @@
+"""
+Jifra 🗼 - RateLimiter のテスト（優先度・繰り上げのある待ち行列が、枠が空けば必ず払い出すこと）
+
+    python -m pytest tests
+"""
+
+import threading
+import time
+
+from jifra.ratelimit import PRIORITY_BATCH, PRIORITY_FREE, PRIORITY_PRO, RateLimiter
+
+def drained(rpm, aging_sec):
+    limiter = RateLimiter(rpm, 10**9, aging_sec)
+    with limiter.cond:
+        limiter.req_tokens = 0.0
+    return limiter
+
+def start(limiter, priority, order=None):
+    def work():
+        limiter.acquire(1, priority)
+        if order is not None:
+            order.append(priority)
+    thread = threading.Thread(target=work, daemon=True)
+    thread.start()
+    return thread
+
+def test_mixed_priority_drain_does_not_stall():
+    # 1件の BATCH の後に FREE が6件: 繰り上げで先頭が替わっても、枠が空くたびに誰かが通る（0.1秒に1件）
+    for _ in range(10):
+        limiter = drained(600, 0.3)
+        threads = [start(limiter, PRIORITY_BATCH)]
+        time.sleep(0.01)
+        threads += [start(limiter, PRIORITY_FREE) for _ in range(6)]
+        started = time.monotonic()
+        for t in threads:
+            t.join(3)
+        assert not any(t.is_alive() for t in threads)
+        assert time.monotonic() - started < 1.5
+
+def test_higher_priority_goes_first():
+    limiter = drained(600, 10.0)
+    order = []
+    threads = [start(limiter, PRIORITY_BATCH, order)]
+    time.sleep(0.01)
+    threads.append(start(limiter, PRIORITY_PRO, order))
+    for t in threads:
+        t.join(3)
+    assert order == [PRIORITY_PRO, PRIORITY_BATCH]
+
+def test_try_acquire_never_jumps_the_queue():
+    limiter = drained(600, 1.0)
+    thread = start(limiter, PRIORITY_FREE)
+    time.sleep(0.01)
+    assert not limiter.try_acquire(1)
+    thread.join(3)
+    time.sleep(0.11)
+    assert limiter.try_acquire(1)
@@ -0,0 +1,82 @@
+"""
+Jifra 🗼 - ModelRouter のテスト（スタブのモデルで、ヘッジ・429 の切り替え・休止を確認する）
+
+    python -m pytest tests
+"""
+
+import time
+
+import pytest
+
+from jifra.models import ModelRouter
+
+class StubModel:
+    # delay 秒待って応答する。error を渡すとその例外を投げる
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def bind(self, template):
+        return self
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise RuntimeError(self.error)
+        return f"{self.name}: {contents}"
+
+def make_router(models, try_acquire=None, workers=8):
+    return ModelRouter(models, window=50, hedge_min_sec=0.01, hedge_default_sec=0.05, cooldown_sec=0.3,
+                       try_acquire=try_acquire, workers=workers)
+
+def test_hedges_slow_primary():
+    slow, fast = StubModel("slow", delay=0.5), StubModel("fast")
+    router = make_router([slow, fast])
+    started = time.perf_counter()
+    assert router.generate(None, "x", {}) == "fast: x"
+    assert time.perf_counter() - started < 0.3
+    snap = router.snapshot()
+    assert snap["hedges"] == 1
+    assert {m["model"]: m["wins"] for m in snap["models"]}["fast"] == 1
+
+def test_no_hedge_without_rate_limit_headroom():
+    slow, fast = StubModel("slow", delay=0.15), StubModel("fast")
+    router = make_router([slow, fast], try_acquire=lambda contents: False)
+    assert router.generate(None, "x", {}) == "slow: x"
+    assert fast.calls == 0
+
+def test_pool_wait_does_not_count_toward_deadline():
+    # 1スレッドのプールを別の呼び出しが塞いでいても、主モデルが始まるまではヘッジしない
+    primary, backup = StubModel("primary", delay=0.01), StubModel("backup")
+    router = make_router([primary, backup], workers=1)
+    router.pool.submit(time.sleep, 0.2)
+    assert router.generate(None, "x", {}) == "primary: x"
+    assert router.snapshot()["hedges"] == 0
+    assert backup.calls == 0
+
+def test_failover_on_429_and_cooldown():
+    throttled, backup = StubModel("throttled", error="429 Resource has been exhausted"), StubModel("backup")
+    router = make_router([throttled, backup])
+    assert router.generate(None, "x", {}) == "backup: x"
+    assert router.snapshot()["failovers"] == 1
+    # 休止中は後回し、cooldown_sec を過ぎれば優先順に戻る
+    assert [m.name for m in router.order()] == ["backup", "throttled"]
+    time.sleep(0.35)
+    assert [m.name for m in router.order()] == ["throttled", "backup"]
+
+def test_failover_respects_rate_limit():
+    throttled, backup = StubModel("throttled", error="429 Resource has been exhausted"), StubModel("backup")
+    router = make_router([throttled, backup], try_acquire=lambda contents: False)
+    with pytest.raises(RuntimeError, match="429"):
+        router.generate(None, "x", {})
+    assert backup.calls == 0
+
+def test_other_errors_do_not_fail_over():
+    broken, backup = StubModel("broken", error="500 Internal"), StubModel("backup")
+    router = make_router([broken, backup])
+    with pytest.raises(RuntimeError, match="500"):
+        router.generate(None, "x", {})
+    assert backup.calls == 0
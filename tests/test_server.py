@@ -0,0 +1,38 @@
+"""
+Jifra 🗼 - HTTP API のテスト（本文を読む前の Content-Length の検証）
+
+    python -m pytest tests
+"""
+
+import socket
+import threading
+import types
+
+import pytest
+
+from jifra.config import Config
+from jifra.server import serve
+
+@pytest.fixture
+def port():
+    # 本文を読む前に返る経路だけを試すので、エンジンは設定だけを持つスタブで足りる
+    server = serve(types.SimpleNamespace(config=Config()), "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def status(port, headers):
+    with socket.create_connection(("127.0.0.1", port), timeout=3) as s:
+        s.sendall(b"POST /translate HTTP/1.1\r\nHost: x\r\nConnection: close\r\n" + headers + b"\r\n")
+        return int(s.recv(4096).split(b" ", 2)[1])
+
+@pytest.mark.parametrize("value", [b"abc", b"-5", b"+5", b"\xb2", b"\xd9\xa3", b"1e3", b""])
+def test_invalid_content_length_is_rejected(port, value):
+    assert status(port, b"Content-Length: " + value + b"\r\n") == 400
+
+def test_missing_content_length(port):
+    assert status(port, b"") == 411
+
+def test_oversized_body(port):
+    assert status(port, b"Content-Length: 999999999\r\n") == 413